@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Runs the backend affinity policy against a stand-in server with one
+# fast and several slow backends, and compares it to staying on
+# whatever backend the load balancer assigns. Logged in sessions are
+# run too, since the stand-in's backends (like the real ones) only know
+# their own sessions: the policy must never cost us our login. Usage:
+# python -m benchmarks.affinity_check [requests] [backend latencies in ms]
+import sys
+import time
+from benchmarks.standin import StandinServer, StandinConfig
+from core import logger, webrequest
+from core.auth.affinity import AffinityPolicy
+from core.auth.cookies import SessionCookies
+from core.auth.login import LoginManager
+from core.logger import LogType
+
+
+def run_session(request_count, login=False):
+    # Returns the mean request latency of a single session, in seconds,
+    # and whether the session is still logged in at the end
+    cookies = SessionCookies()
+    login_manager = LoginManager(cookies)
+    if login:
+        login_manager.captcha.answer = "1,1"
+        login_manager.login("standin", "standin")
+    start_time = time.perf_counter()
+    for i in range(request_count):
+        login_manager.is_logged_in()
+    latency = (time.perf_counter() - start_time) / request_count
+    return latency, login_manager.is_logged_in()
+
+
+def run(request_count, backend_latencies, session_count=20):
+    config = StandinConfig()
+    config.port = 0
+    config.backend_latencies = backend_latencies
+    server = StandinServer(config)
+    server.start()
+    webrequest.set_base_url(server.base_url)
+    try:
+        results = {}
+        for name, policy in (("no affinity", None), ("affinity policy", AffinityPolicy())):
+            webrequest.affinity_policy = policy
+            latencies = [run_session(request_count)[0] for i in range(session_count)]
+            results[name] = sum(latencies) / len(latencies)
+            print("{0:<16} {1:8.2f} ms/request".format(name, results[name] * 1000))
+            if policy is not None:
+                for stats in policy.table:
+                    print("    {0!r}".format(stats))
+        # The policy should end up on the fast backend most of the time
+        # Sessions only learn which backend is fast by landing on it,
+        # so this needs enough requests to have seen it at least once
+        improved = results["affinity policy"] < results["no affinity"]
+        # Logged in sessions have to stay on their backend, however slow.
+        # The policy already knows which backend is fast by now, so it
+        # would move any session that it was allowed to.
+        webrequest.affinity_policy = policy
+        logged_out = sum(1 for i in range(session_count) if not run_session(request_count, login=True)[1])
+        print("{0} of {1} logged in sessions were logged out".format(logged_out, session_count))
+        return improved and logged_out == 0
+    finally:
+        webrequest.affinity_policy = None
+        webrequest.set_base_url(webrequest.DEFAULT_BASE_URL)
+        server.stop()
+
+
+if __name__ == "__main__":
+    logger.set_enabled_log_types(LogType.NONE)
+    improved = run(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+                   [float(latency) for latency in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1.0, 20.0, 20.0, 20.0])
+    print("Affinity policy " + ("passed" if improved else "FAILED"))
+    sys.exit(0 if improved else 1)
\ No newline at end of file
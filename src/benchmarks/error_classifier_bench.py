@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Compares the old if-chains of string comparisons against the
+# table-driven classifiers, over a set of error messages as the
+# server returns them. Usage:
+# python -m benchmarks.error_classifier_bench [iterations]
+import sys
+import timeit
+from core.auth.login import LOGIN_ERRORS, InvalidUsernameError, InvalidPasswordError
+from core.auth.login import TooManyLoginAttemptsError, SystemMaintenanceError
+from core.auth.purchase import SUBMIT_ORDER_ERRORS, QUEUE_POLL_ERRORS, ServerBusyError
+from core.auth.purchase import UnfinishedTransactionError, DataExpiredError
+
+
+MESSAGES = [
+    "登录名不存在!",
+    "密码输入错误。如果输错次数超过4次，用户将被锁定。",
+    "您的用户已经被锁定，请稍后重试。",
+    "密码输入次数已超过4次，您的用户已经被锁定，请20分钟后重试。",
+    "对不起，现在是系统维护时间",
+    "您还有未处理的订单，请您到[未完成订单]中进行处理!",
+    "车票信息已过期，请重新查询最新车票信息",
+    "系统繁忙，请稍后重试！",
+    "网络繁忙，请稍后重试",
+    "非法请求",
+    "验证码输入错误!",
+    "用户未登录"
+]
+
+
+def old_classify(msg):
+    if msg == "登录名不存在!":
+        return InvalidUsernameError
+    if msg.startswith("密码输入错误"):
+        return InvalidPasswordError
+    if msg.startswith(("您的用户已经被锁定", "密码输入次数已超过")):
+        return TooManyLoginAttemptsError
+    if msg.endswith("系统维护时间"):
+        return SystemMaintenanceError
+    if msg.startswith("您还有未处理的订单"):
+        return UnfinishedTransactionError
+    if msg.startswith("车票信息已过期"):
+        return DataExpiredError
+    if msg.startswith(("系统繁忙", "网络繁忙", "系统忙")):
+        return ServerBusyError
+    return None
+
+
+def new_classify(msg):
+    return LOGIN_ERRORS.classify(msg) or SUBMIT_ORDER_ERRORS.classify(msg) or QUEUE_POLL_ERRORS.classify(msg)
+
+
+def run(iterations):
+    for msg in MESSAGES:
+        assert old_classify(msg) is new_classify(msg), msg
+    cases = [
+        ("if-chains (all)", lambda: [old_classify(msg) for msg in MESSAGES]),
+        ("classifiers (all)", lambda: [new_classify(msg) for msg in MESSAGES]),
+        ("queue poll only", lambda: [QUEUE_POLL_ERRORS.classify(msg) for msg in MESSAGES]),
+    ]
+    for name, func in cases:
+        elapsed = timeit.timeit(func, number=iterations)
+        print("{0:<20} {1:8.3f} us/message".format(name, elapsed / iterations / len(MESSAGES) * 1e6))
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
\ No newline at end of file
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Micro-benchmark for disabled log levels. Usage:
+# python -m benchmarks.logger_bench [iterations]
+import sys
+import timeit
+from core import logger
+from core.logger import LogType
+
+
+class _FakeTrain:
+    name = "T110"
+
+
+def run(iterations):
+    train = _FakeTrain()
+    kwargs = {"params": [("a", "1"), ("b", "2")], "cookies": None}
+    cases = [
+        ("empty loop", lambda: None),
+        ("eager concatenation", lambda: logger.debug("Fetched ticket prices for train " + train.name)),
+        ("deferred formatting", lambda: logger.debug("Fetched ticket prices for train {0}", train.name)),
+        ("guarded network log", lambda: logger.NETWORK_ENABLED and logger.network(
+            lambda m, u, k: "[{0}] {1} {2}".format(m, u, k), "get", "https://example.com", kwargs)),
+    ]
+    logger.set_enabled_log_types(LogType.NONE)
+    try:
+        for name, func in cases:
+            elapsed = timeit.timeit(func, number=iterations)
+            print("{0:<24} {1:8.1f} ns/call".format(name, elapsed / iterations * 1e9))
+    finally:
+        logger.set_enabled_log_types(LogType.ALL)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
\ No newline at end of file
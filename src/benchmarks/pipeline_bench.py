@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# End-to-end benchmark of search -> filter -> sort -> purchase, run
+# against a local stand-in server (or a recorded archive) for several
+# result sizes. Reports per-stage throughput, p50/p99 latency and
+# allocations, and writes them to a JSON file so runs from different
+# versions can be compared. The stand-in runs in this process, so its
+# (small) share of the query and purchase times is included; replaying
+# an archive leaves only the client side. Usage:
+#
+# python -m benchmarks.pipeline_bench [--sizes 10,100,1000,10000]
+#     [--output pipeline_bench.json] [--compare old.json]
+#     [--archive recorded.jsonl.gz] [--latency MS]
+import argparse
+import datetime
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from benchmarks.standin import StandinServer, StandinConfig
+from core import logger, webrequest
+from core.auth.cookies import SessionCookies
+from core.auth.login import LoginManager
+from core.auth.purchase import TicketPurchaser
+from core.data.station import StationList
+from core.enums import TicketStatus
+from core.logger import LogType
+from core.processing.containers import ValueRange
+from core.processing.filter import TrainFilter
+from core.processing.sort import TrainSorter
+from core.search.search import TrainQuery
+from core.transport import RequestReplayer
+
+RESULT_VERSION = 1
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+STAGES = ["query", "filter", "sort", "purchase"]
+
+
+def default_iterations(size):
+    # Enough samples for a stable p50 without 10k-train runs taking forever
+    if size <= 10:
+        return 50
+    if size <= 100:
+        return 30
+    if size <= 1000:
+        return 10
+    return 5
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(func, setup, iterations):
+    # Returns (latencies in seconds, peak allocated bytes, allocated blocks).
+    # Allocations are measured in a separate run so that tracemalloc
+    # doesn't slow down the timed ones.
+    latencies = []
+    for i in range(iterations):
+        arg = setup()
+        gc.collect()
+        start_time = time.perf_counter()
+        func(arg)
+        latencies.append(time.perf_counter() - start_time)
+    arg = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        func(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return latencies, peak, blocks
+
+
+def summarize(size, stage, items, latencies, peak, blocks):
+    p50 = percentile(latencies, 0.5)
+    return {
+        "size": size,
+        "stage": stage,
+        "iterations": len(latencies),
+        # Trains handled per second (one per purchase), from the median run
+        "items_per_sec": items / p50 if p50 > 0 else None,
+        "p50_ms": p50 * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "alloc_peak_bytes": peak,
+        "alloc_blocks": blocks
+    }
+
+
+def create_query():
+    station_list = StationList.instance()
+    query = TrainQuery()
+    query.departure_station = station_list.get_by_id("BJP")
+    query.destination_station = station_list.get_by_id("SHH")
+    query.date = datetime.date.today() + datetime.timedelta(days=3)
+    return query
+
+
+def create_filter():
+    train_filter = TrainFilter()
+    train_filter.departure_time_range = ValueRange(datetime.time(7, 0), datetime.time(21, 0))
+    return train_filter
+
+
+def create_sorter(train_list):
+    sorter = TrainSorter()
+    sorter.sort_methods = [
+        lambda trains: TrainSorter.sort_by_duration(trains, False),
+        lambda trains: TrainSorter.sort_by_departure_time(trains, False)
+    ]
+    sorter.favorites = {train.name: i for i, train in enumerate(train_list[:5])}
+    return sorter
+
+
+def login():
+    cookies = SessionCookies()
+    login_manager = LoginManager(cookies)
+    login_manager.captcha.answer = "1,1"
+    login_manager.login("benchmark", "benchmark")
+    return cookies
+
+
+def purchase(cookies, train):
+    purchaser = TicketPurchaser(cookies)
+    purchaser.queue_min_delay = 0.001
+    purchaser.queue_max_delay = 0.001
+    purchaser.train = train
+    purchase_data = purchaser.begin_purchase()
+    passenger = purchaser.get_passenger_list()[0]
+    ticket = [t for t in train.tickets if t.status == TicketStatus.NORMAL][0]
+    purchase_data.ticket_map = {passenger: ticket}
+    purchaser.captcha.answer = "1,1"
+    order_id = purchaser.complete_purchase(purchase_data)
+    assert order_id is not None
+    return order_id
+
+
+def run_size(size, iterations):
+    # Runs every stage for the trains currently served; returns the results
+    query = create_query()
+    train_filter = create_filter()
+    results = []
+
+    latencies, peak, blocks = measure(lambda arg: query.execute(), lambda: None, iterations)
+    train_list = query.execute()
+    results.append(summarize(size, "query", len(train_list), latencies, peak, blocks))
+
+    latencies, peak, blocks = measure(train_filter.filter, lambda: train_list, iterations)
+    filtered_list = train_filter.filter(train_list)
+    results.append(summarize(size, "filter", len(train_list), latencies, peak, blocks))
+
+    sorter = create_sorter(filtered_list)
+    latencies, peak, blocks = measure(sorter.sort, lambda: list(filtered_list), iterations)
+    results.append(summarize(size, "sort", len(filtered_list), latencies, peak, blocks))
+
+    buyable = [train for train in filtered_list if train.can_buy] or [t for t in train_list if t.can_buy]
+    if len(buyable) > 0:
+        cookies = login()
+        purchase_iterations = min(iterations, 10)
+        latencies, peak, blocks = measure(lambda train: purchase(cookies, train),
+                                          lambda: buyable[0], purchase_iterations)
+        results.append(summarize(size, "purchase", 1, latencies, peak, blocks))
+    return results
+
+
+def run_standin(sizes, latency, iterations):
+    results = []
+    for size in sizes:
+        config = StandinConfig()
+        config.port = 0
+        config.train_count = size
+        config.latency = latency
+        # Never run out of tickets or wait in the order queue
+        config.max_tickets = 2999
+        config.queue_polls = 1
+        server = StandinServer(config)
+        server.start()
+        webrequest.set_base_url(server.base_url)
+        try:
+            StationList.load_list()
+            results.extend(run_size(size, iterations or default_iterations(size)))
+        finally:
+            server.stop()
+            webrequest.set_base_url(webrequest.DEFAULT_BASE_URL)
+        print_results([r for r in results if r["size"] == size])
+    return results
+
+
+def run_archive(path, iterations):
+    replayer = RequestReplayer.load(path)
+    webrequest.transport = replayer
+    try:
+        StationList.load_list()
+        size = len(create_query().execute())
+        replayer.reset()
+        StationList.load_list()
+        results = run_size(size, iterations or default_iterations(size))
+    finally:
+        webrequest.transport = None
+    print_results(results)
+    return results
+
+
+def print_results(results):
+    for result in results:
+        print("{size:>6} {stage:<9} {items_per_sec:>12.0f}/s  p50 {p50_ms:9.3f} ms  p99 {p99_ms:9.3f} ms  "
+              "peak {alloc_peak_bytes:>10} B  {alloc_blocks:>7} blocks".format(**result))
+
+
+def compare(results, old_path):
+    with open(old_path, "rt", encoding="utf-8") as f:
+        old_results = {(r["size"], r["stage"]): r for r in json.load(f)["results"]}
+    print("Change in p50 latency and peak allocations vs " + old_path)
+    for result in results:
+        old = old_results.get((result["size"], result["stage"]))
+        if old is None:
+            continue
+        print("{0:>6} {1:<9} p50 {2:+7.1%}  peak {3:+7.1%}".format(
+            result["size"], result["stage"],
+            result["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0,
+            result["alloc_peak_bytes"] / old["alloc_peak_bytes"] - 1 if old["alloc_peak_bytes"] else 0.0))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Search/filter/sort/purchase benchmark")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated train counts (stand-in only)")
+    parser.add_argument("--iterations", type=int, help="timed runs per stage (default depends on size)")
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in latency in milliseconds")
+    parser.add_argument("--archive", help="replay a recorded archive instead of using the stand-in")
+    parser.add_argument("--output", default="pipeline_bench.json")
+    parser.add_argument("--compare", help="results file from an earlier run")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.set_enabled_log_types(LogType.NONE)
+    if args.archive is not None:
+        source = {"archive": args.archive}
+        results = run_archive(args.archive, args.iterations)
+    else:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        source = {"standin": True, "latency_ms": args.latency}
+        results = run_standin(sizes, args.latency, args.iterations)
+    with open(args.output, "wt", encoding="utf-8") as f:
+        json.dump({
+            "version": RESULT_VERSION,
+            "created": time.time(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "source": source,
+            "results": results
+        }, f, indent=2)
+    print("Wrote " + args.output)
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
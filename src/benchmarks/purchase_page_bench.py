@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Compares the old full-page regex token extraction against the
+# streaming scanner. Usage:
+# python -m benchmarks.purchase_page_bench [saved initDc page] [iterations]
+import re
+import sys
+import timeit
+from core.auth.purchase import scan_purchase_page
+
+
+def generate_page():
+    # Roughly the shape of the initDc page: a big pile of markup
+    # and scripts, with the tokens somewhere in the first half.
+    filler = "<div class=\"row\"><span>填写乘客信息</span><input type=\"text\" value=\"\" /></div>\n" * 1500
+    return (
+        "<!DOCTYPE html><html><head><title>12306</title>\n" + filler +
+        "<script type=\"text/javascript\">\n"
+        "var globalRepeatSubmitToken = '2f8a8e6f1c0b4d6aa2b0a4c3e0f1d2c3';\n"
+        "var ticketInfoForPassengerForm={'cardTypes':[],'key_check_isChange':"
+        "'D1D2E3F4A5B6C7D8E9F0A1B2C3D4E5F6A7B8C9D0E1F2A3B4C5D6E7F8'};\n"
+        "</script>\n" + filler * 2 + "</html>"
+    ).encode("utf-8")
+
+
+def old_extract(content):
+    text = content.decode("utf-8")
+    submit_token = re.match(".*var\\s+globalRepeatSubmitToken\\s*=\\s*['\"]([^'\"]*).*", text, flags=re.S).group(1)
+    purchase_key = re.match(".*['\"]key_check_isChange['\"]\\s*:\\s*['\"]([^'\"]*).*", text, flags=re.S).group(1)
+    return submit_token, purchase_key
+
+
+def new_extract(content, chunk_size=8192):
+    chunks = (content[i:i+chunk_size] for i in range(0, len(content), chunk_size))
+    return scan_purchase_page(chunks)
+
+
+def run(content, iterations):
+    assert old_extract(content) == new_extract(content)
+    print("Page size: {0} bytes".format(len(content)))
+    for name, func in (("full-page re.match", old_extract), ("streaming scanner", new_extract)):
+        elapsed = timeit.timeit(lambda: func(content), number=iterations)
+        print("{0:<20} {1:10.1f} us/page".format(name, elapsed / iterations * 1e6))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            page = f.read()
+    else:
+        page = generate_page()
+    run(page, int(sys.argv[2]) if len(sys.argv) > 2 else 50)
\ No newline at end of file
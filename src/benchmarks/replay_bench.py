@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Times parsing real (recorded) train query responses offline: JSON
+# decoding, building the trains and filtering them. If the archive
+# holds a route search, PathFinder is timed on it as well. Record an
+# archive by setting record_path in the config and running a search, then:
+# python -m benchmarks.replay_bench [archive] [iterations]
+#
+# Without an archive, one is recorded from a local stand-in server.
+import datetime
+import os
+import sys
+import tempfile
+import timeit
+import urllib.parse
+from benchmarks.standin import StandinServer, StandinConfig
+from core import jsonwrapper, timeconverter, webrequest
+from core.data.station import StationList
+from core.data.timetable import TimetableCache
+from core.data.train import Train
+from core.enums import TicketPricing
+from core.processing.containers import ValueRange
+from core.processing.filter import TrainFilter
+from core.search.pathing import PathFinder
+from core.search.search import TrainQuery
+from core.transport import RequestRecorder, RequestReplayer, read_archive
+
+# The number of trains to plan a route from when recording
+ROUTE_TRAIN_COUNT = 2
+
+
+def select_untried(tried):
+    # Always takes the first train that hasn't been tried yet, so
+    # that recording and replaying a route search make the same
+    # requests (and every search ends, since trains run out).
+    def select(train_list):
+        for train in train_list:
+            key = (train.id, train.departure_time, train.destination_station.id)
+            if key not in tried:
+                tried.add(key)
+                return train
+        return None
+    return select
+
+
+def find_paths(train_list):
+    path_finder = PathFinder(None)
+    # Transfer at every station on the way, so that each route
+    # takes several levels of train queries
+    path_finder.only_show_longest_path = False
+    path_finder.transfer_time_range = ValueRange(datetime.timedelta(minutes=10), datetime.timedelta(hours=2))
+    paths = []
+    for train in train_list:
+        path_finder.path_selector = select_untried(set())
+        paths.append(path_finder.get_path(train))
+    return paths
+
+
+def record_standin_archive(path):
+    config = StandinConfig()
+    config.port = 0
+    config.train_count = 500
+    server = StandinServer(config)
+    server.start()
+    webrequest.set_base_url(server.base_url)
+    recorder = RequestRecorder(path)
+    webrequest.transport = recorder
+    try:
+        StationList.load_list()
+        station_list = StationList.instance()
+        query = TrainQuery()
+        query.departure_station = station_list.get_by_id("BJP")
+        query.destination_station = station_list.get_by_id("SHH")
+        query.date = datetime.date.today() + datetime.timedelta(days=3)
+        find_paths(query.execute()[:ROUTE_TRAIN_COUNT])
+    finally:
+        webrequest.transport = None
+        webrequest.set_base_url(webrequest.DEFAULT_BASE_URL)
+        recorder.close()
+        server.stop()
+
+
+def load_route_trains(station_list, exchanges, timetable_exchanges):
+    # The trains a recorded route search started from: those in the
+    # first train query whose timetables were looked up
+    params = dict(urllib.parse.parse_qsl(exchanges[0].query))
+    query = TrainQuery()
+    query.departure_station = station_list.get_by_id(params["leftTicketDTO.from_station"])
+    query.destination_station = station_list.get_by_id(params["leftTicketDTO.to_station"])
+    query.date = timeconverter.str_to_date(params["leftTicketDTO.train_date"])
+    train_ids = set(dict(urllib.parse.parse_qsl(e.query)).get("train_no") for e in timetable_exchanges)
+    return [train for train in query.execute() if train.id in train_ids]
+
+
+def run(path, iterations):
+    archive = read_archive(path)
+    exchanges = [e for e in archive if e.endpoint == "leftTicket/query" and e.status == 200]
+    timetable_exchanges = [e for e in archive if e.endpoint == "czxx/queryByTrainNo" and e.status == 200]
+    if len(exchanges) == 0:
+        print("No train queries in " + path)
+        return
+    print("{0} train queries, {1:.1f} KiB of responses".format(
+        len(exchanges), sum(len(e.content) for e in exchanges) / 1024))
+
+    # Station list (and anything else the queries need) come from the archive too
+    replayer = RequestReplayer(archive)
+    webrequest.transport = replayer
+    StationList.load_list()
+    station_list = StationList.instance()
+
+    responses = [e.create_response() for e in exchanges]
+    json_list = [jsonwrapper.read(r)["data"] for r in responses]
+    train_lists = []
+    for json_data in json_list:
+        trains = []
+        for train_data in json_data:
+            query_data = train_data["queryLeftNewDTO"]
+            trains.append(Train(train_data,
+                                station_list.get_by_id(query_data["from_station_telecode"]),
+                                station_list.get_by_id(query_data["to_station_telecode"]),
+                                TicketPricing.NORMAL,
+                                datetime.date.today()))
+        train_lists.append(trains)
+    train_count = sum(len(trains) for trains in train_lists)
+    train_filter = TrainFilter()
+
+    def build_trains():
+        for json_data, trains in zip(json_list, train_lists):
+            for train_data, train in zip(json_data, trains):
+                Train(train_data, train.departure_station, train.destination_station,
+                      TicketPricing.NORMAL, datetime.date.today())
+
+    stages = [
+        ("jsonwrapper.read", lambda: [jsonwrapper.read(r) for r in responses], train_count, "trains"),
+        ("Train.__init__", build_trains, train_count, "trains"),
+        ("TrainFilter.filter", lambda: [train_filter.filter(trains) for trains in train_lists], train_count, "trains")
+    ]
+
+    if len(timetable_exchanges) > 0:
+        route_trains = load_route_trains(station_list, exchanges, timetable_exchanges)
+
+        def find_route_paths():
+            # Start over, so every pass makes the same requests
+            # and fetches its timetables instead of using the cache
+            replayer.reset()
+            TimetableCache.instance().clear()
+            find_paths(route_trains)
+
+        stages.append(("PathFinder.get_path", find_route_paths, len(route_trains), "routes"))
+
+    for name, func, count, unit in stages:
+        elapsed = timeit.timeit(func, number=iterations) / iterations
+        print("{0:<20} {1:10.1f} us/pass {2:12.0f} {3}/s".format(
+            name, elapsed * 1e6, count / elapsed if elapsed > 0 else 0, unit))
+    webrequest.transport = None
+
+
+if __name__ == "__main__":
+    archive_path = sys.argv[1] if len(sys.argv) > 1 else None
+    iteration_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    if archive_path is not None:
+        run(archive_path, iteration_count)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            archive_path = os.path.join(temp_dir, "standin.jsonl.gz")
+            record_standin_archive(archive_path)
+            run(archive_path, iteration_count)
\ No newline at end of file
@@ -0,0 +1,634 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# A local stand-in for the parts of the 12306 API that the client uses,
+# for load testing and benchmarking without touching the real site.
+# Responses are generated from a seeded, synthetic timetable (or served
+# verbatim from recorded fixtures), with optional latency, errors and
+# other buyers eating into the ticket counts. Usage:
+#
+# python -m benchmarks.standin [--port 8306] [--trains 100] [--latency 50] ...
+#
+# and then point the client at it with base_url = "http://127.0.0.1:8306/otn/"
+import argparse
+import base64
+import datetime
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from core.enums import TicketType
+
+# (name, ID, pinyin, abbreviation); every train runs through all of
+# these stations in order
+STATIONS = [
+    ("北京", "BJP", "beijing", "bj"),
+    ("天津", "TJP", "tianjin", "tj"),
+    ("济南", "JNK", "jinan", "jn"),
+    ("徐州", "XCH", "xuzhou", "xz"),
+    ("南京", "NJH", "nanjing", "nj"),
+    ("上海", "SHH", "shanghai", "sh")
+]
+
+# The seat types every train has, with their price per station hop
+SEAT_TYPES = [
+    (TicketType.SECOND_CLASS, "ze", 90.5),
+    (TicketType.FIRST_CLASS, "zy", 150.0),
+    (TicketType.BUSINESS, "swz", 280.0)
+]
+
+# Prices as "¥123.5" are keyed by the two-character seat type ID
+PRICE_KEY_LOOKUP = {value: key for key, value in TicketType.REVERSE_ID2_LOOKUP.items()}
+
+BUSY_MESSAGE = "系统繁忙，请稍后重试！"
+EXPIRED_MESSAGE = "车票信息已过期，请重新查询最新车票信息"
+
+
+class StandinConfig:
+    def __init__(self):
+        self.host = "127.0.0.1"
+        self.port = 8306
+        # Seed for everything random, so runs are reproducible
+        self.seed = 12306
+        # Number of trains in the timetable
+        self.train_count = 100
+        # Initial tickets per seat type per train
+        self.max_tickets = 500
+        # Added to every response, in milliseconds (mean and jitter)
+        self.latency = 0.0
+        self.jitter = 0.0
+        # Fraction of JSON responses replaced with a "system busy"
+        # message, and of all responses failed with HTTP 502
+        self.busy_rate = 0.0
+        self.http_error_rate = 0.0
+        # Each train query, every ticket count drops by up to this
+        # many tickets (other people buying them)
+        self.sell_rate = 0
+        # How long a secretStr stays valid, in seconds
+        self.secret_ttl = 300.0
+        # How many queue polls before an order goes through
+        self.queue_polls = 2
+        # Extra latency in milliseconds of each backend behind the load
+        # balancer. Clients without a (valid) BIGipServerotn cookie are
+        # assigned a random backend, and stay on it while they send the
+        # cookie back.
+        self.backend_latencies = [0.0]
+        # Directory of recorded responses; <dir>/<endpoint>.json (e.g.
+        # fixtures/leftTicket/query.json) is served as-is when present.
+        # benchmarks/fixtures holds a recorded leftTicketPrice/query response.
+        self.fixtures = None
+
+
+class StandinState:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        # train_no -> train spec
+        self.trains = {}
+        for i in range(config.train_count):
+            train_no = "24000000G{0:03d}0C".format(i % 1000) + str(i // 1000)
+            self.trains[train_no] = {
+                "train_no": train_no,
+                "code": "G{0}".format(i + 1),
+                # Minutes after midnight that the train leaves the first station
+                "departure": 6 * 60 + (i * 17) % (16 * 60),
+                "counts": {seat_type: self.random.randint(0, config.max_tickets)
+                           for seat_type, abbreviation, price in SEAT_TYPES}
+            }
+        # BIGipServerotn value -> backend index
+        self.backend_cookies = {encode_backend(i): i for i in range(len(config.backend_latencies))}
+        # (backend index, JSESSIONID) -> session; like the real backends,
+        # each one only knows the sessions that were logged in on it
+        self.sessions = {}
+        # REPEAT_SUBMIT_TOKEN -> order
+        self.orders = {}
+
+    def sell(self):
+        # Other buyers take some tickets off every train
+        sell_rate = self.config.sell_rate
+        if sell_rate <= 0:
+            return
+        for train in self.trains.values():
+            counts = train["counts"]
+            for seat_type in counts:
+                counts[seat_type] = max(0, counts[seat_type] - self.random.randint(0, sell_rate))
+
+
+def encode_backend(index):
+    # 127.0.0.<index + 1>:80 in the load balancer's encoding
+    return "{0}.20480.0000".format(((index + 1) << 24) | 0x7f)
+
+
+def station_index(station_id):
+    for i, station in enumerate(STATIONS):
+        if station[1] == station_id:
+            return i
+    return None
+
+
+def format_minutes(minutes):
+    minutes %= 24 * 60
+    return "{0:02d}:{1:02d}".format(minutes // 60, minutes % 60)
+
+
+def encode_secret(train_no, issue_time):
+    raw = "{0}#{1:.3f}".format(train_no, issue_time).encode("ascii")
+    return urllib.parse.quote(base64.b64encode(raw).decode("ascii"))
+
+
+def decode_secret(secret):
+    try:
+        train_no, issue_time = base64.b64decode(secret).decode("ascii").split("#")
+        return train_no, float(issue_time)
+    except (ValueError, UnicodeDecodeError):
+        return None, None
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, which would
+    # otherwise stall on delayed ACKs with keep-alive connections
+    disable_nagle_algorithm = True
+    # Set on the server class by StandinServer
+    state = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def __send(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        for name, value in self.__balancer_headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data=None, status=True, messages=(), headers=()):
+        body = json.dumps({
+            "validateMessagesShowId": "_validatorMessage",
+            "status": status,
+            "httpstatus": 200,
+            "data": data,
+            "messages": list(messages),
+            "validateMessages": {}
+        }, ensure_ascii=False).encode("utf-8")
+        self.__send(200, body, "application/json;charset=UTF-8", headers)
+
+    def send_text(self, text, content_type="text/html;charset=utf-8", headers=()):
+        self.__send(200, text.encode("utf-8"), content_type, headers)
+
+    def __read_args(self):
+        split = urllib.parse.urlsplit(self.path)
+        args = dict(urllib.parse.parse_qsl(split.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > 0:
+            args.update(urllib.parse.parse_qsl(self.rfile.read(length).decode("utf-8")))
+        return split.path, args
+
+    def __get_cookie(self, cookie_name):
+        cookies = self.headers.get("Cookie", "")
+        for part in cookies.split(";"):
+            name, sep, value = part.strip().partition("=")
+            if name == cookie_name:
+                return value
+        return None
+
+    def __get_session(self):
+        state = self.state
+        with state.lock:
+            return state.sessions.get((self.backend, self.__get_cookie("JSESSIONID")))
+
+    def __get_backend(self):
+        # Routes the request like the load balancer would
+        state = self.state
+        backend = state.backend_cookies.get(self.__get_cookie("BIGipServerotn"))
+        if backend is None:
+            with state.lock:
+                backend = state.random.randrange(len(state.backend_cookies))
+            self.__balancer_headers.append(("Set-Cookie", "BIGipServerotn={0}; Path=/".format(encode_backend(backend))))
+        return backend
+
+    def __handle(self):
+        state = self.state
+        config = state.config
+        self.__balancer_headers = []
+        path, args = self.__read_args()
+        # The backend serving this request
+        self.backend = self.__get_backend()
+        latency = config.latency + config.backend_latencies[self.backend]
+        if latency > 0 or config.jitter > 0:
+            with state.lock:
+                delay = max(0.0, state.random.gauss(latency, config.jitter))
+            time.sleep(delay / 1000)
+        with state.lock:
+            http_error = state.random.random() < config.http_error_rate
+            busy = state.random.random() < config.busy_rate
+        if http_error:
+            self.__send(502, b"Bad Gateway", "text/plain")
+            return
+        endpoint = path[5:] if path.startswith("/otn/") else path.lstrip("/")
+        if config.fixtures is not None:
+            fixture_path = os.path.join(config.fixtures, endpoint + ".json")
+            if os.path.isfile(fixture_path):
+                with open(fixture_path, "rb") as f:
+                    self.__send(200, f.read(), "application/json;charset=UTF-8")
+                return
+        handler = ROUTES.get(endpoint)
+        if handler is None:
+            self.__send(404, b"Not Found", "text/plain")
+            return
+        if busy and not endpoint.endswith((".js", ".do")):
+            self.send_json(status=False, messages=[BUSY_MESSAGE])
+            return
+        # Handlers take state.lock themselves, only around the state
+        # they touch, so concurrent requests aren't serialized
+        handler(self, state, args, self.__get_session())
+
+    def do_GET(self):
+        self.__handle()
+
+    def do_POST(self):
+        self.__handle()
+
+
+# ------------------------------Endpoint handlers------------------------------
+def handle_station_names(handler, state, args, session):
+    entries = ["@{3}|{0}|{1}|{2}|{3}|{4}".format(name, station_id, pinyin, abbreviation, i)
+               for i, (name, station_id, pinyin, abbreviation) in enumerate(STATIONS)]
+    handler.send_text("var station_names ='" + "".join(entries) + "';", "application/javascript")
+
+
+def handle_train_list(handler, state, args, session):
+    today = datetime.date.today()
+    dates = []
+    for day in range(20):
+        train_date = (today + datetime.timedelta(days=day)).strftime("%Y-%m-%d")
+        trains = ",".join('{{"station_train_code":"{0}({1}-{2})","train_no":"{3}"}}'.format(
+            train["code"], STATIONS[0][0], STATIONS[-1][0], train["train_no"]) for train in state.trains.values())
+        dates.append('"{0}":{{"G":[{1}]}}'.format(train_date, trains))
+    handler.send_text("var train_list ={" + ",".join(dates) + "}", "application/javascript")
+
+
+def create_query_data(train, counts, from_index, to_index, train_date):
+    hops = to_index - from_index
+    departure = train["departure"] + from_index * 60
+    query_data = {
+        "train_no": train["train_no"],
+        "station_train_code": train["code"],
+        "start_station_telecode": STATIONS[0][1],
+        "end_station_telecode": STATIONS[-1][1],
+        "from_station_telecode": STATIONS[from_index][1],
+        "to_station_telecode": STATIONS[to_index][1],
+        "start_time": format_minutes(departure),
+        "arrive_time": format_minutes(departure + hops * 60),
+        "lishi": format_minutes(hops * 60),
+        "lishiValue": str(hops * 60),
+        "canWebBuy": "Y" if any(counts.values()) else "N",
+        "start_train_date": train_date.replace("-", ""),
+        "location_code": "P2",
+        "from_station_no": "{0:02d}".format(from_index + 1),
+        "to_station_no": "{0:02d}".format(to_index + 1),
+        "seat_types": "".join(TicketType.ID_LOOKUP[seat_type] for seat_type, a, p in SEAT_TYPES),
+        "sale_time": "0800"
+    }
+    for abbreviation in TicketType.REVERSE_ABBREVIATION_LOOKUP:
+        query_data[abbreviation + "_num"] = "--"
+    yp_info = []
+    for seat_type, abbreviation, price in SEAT_TYPES:
+        # yp_info counts of 3000 and up mean standing tickets
+        count = min(counts[seat_type], 2999)
+        query_data[abbreviation + "_num"] = str(count) if count > 0 else "无"
+        yp_info.append("{0}{1:05d}{2:04d}".format(
+            TicketType.ID_LOOKUP[seat_type], int(price * hops * 10) % 100000, count))
+    query_data["yp_info"] = "".join(yp_info)
+    return query_data
+
+
+def handle_query(handler, state, args, session):
+    from_index = station_index(args.get("leftTicketDTO.from_station"))
+    to_index = station_index(args.get("leftTicketDTO.to_station"))
+    train_date = args.get("leftTicketDTO.train_date", "")
+    if from_index is None or to_index is None or from_index >= to_index:
+        handler.send_json([])
+        return
+    with state.lock:
+        state.sell()
+        counts = [(train, dict(train["counts"])) for train in state.trains.values()]
+    now = time.time()
+    data = [{
+        "queryLeftNewDTO": create_query_data(train, train_counts, from_index, to_index, train_date),
+        "secretStr": encode_secret(train["train_no"], now),
+        "buttonTextInfo": "预订"
+    } for train, train_counts in counts]
+    handler.send_json(data)
+
+
+def create_price_data(from_index, to_index):
+    hops = to_index - from_index
+    return {PRICE_KEY_LOOKUP[seat_type]: "¥{0:.1f}".format(price * hops)
+            for seat_type, abbreviation, price in SEAT_TYPES}
+
+
+def handle_ticket_price(handler, state, args, session):
+    from_index = int(args.get("from_station_no", "1")) - 1
+    to_index = int(args.get("to_station_no", str(len(STATIONS)))) - 1
+    handler.send_json(create_price_data(from_index, to_index))
+
+
+def handle_bulk_price(handler, state, args, session):
+    from_index = station_index(args.get("leftTicketDTO.from_station"))
+    to_index = station_index(args.get("leftTicketDTO.to_station"))
+    if from_index is None or to_index is None or from_index >= to_index:
+        handler.send_json([])
+        return
+    data = []
+    for train in state.trains.values():
+        price_data = create_price_data(from_index, to_index)
+        price_data["train_no"] = train["train_no"]
+        price_data["from_station_telecode"] = STATIONS[from_index][1]
+        price_data["to_station_telecode"] = STATIONS[to_index][1]
+        data.append({"queryLeftNewDTO": price_data})
+    handler.send_json(data)
+
+
+def handle_train_stops(handler, state, args, session):
+    train = state.trains.get(args.get("train_no") or args.get("leftTicketDTO.train_no"))
+    if train is None:
+        handler.send_json({"data": []})
+        return
+    from_index = station_index(args.get("from_station_telecode"))
+    to_index = station_index(args.get("to_station_telecode"))
+    stops = []
+    for i, (name, station_id, pinyin, abbreviation) in enumerate(STATIONS):
+        arrival = train["departure"] + i * 60 - 2
+        stops.append({
+            "station_no": "{0:02d}".format(i + 1),
+            "station_name": name,
+            "arrive_time": "----" if i == 0 else format_minutes(arrival),
+            "start_time": "----" if i == len(STATIONS) - 1 else format_minutes(arrival + 2),
+            "stopover_time": "2分钟",
+            "isEnabled": from_index is None or from_index <= i <= (to_index or 0)
+        })
+    handler.send_json({"data": stops})
+
+
+def handle_captcha_image(handler, state, args, session):
+    # Not a real image, but the client only checks the content type
+    handler.send_text("\xff\xd8\xff\xe0standin", "image/jpeg")
+
+
+def handle_captcha_check(handler, state, args, session):
+    handler.send_json("Y")
+
+
+def handle_login(handler, state, args, session):
+    session_id = uuid.uuid4().hex
+    with state.lock:
+        state.sessions[(handler.backend, session_id)] = {"username": args.get("loginUserDTO.user_name"), "token": None}
+    handler.send_json({"loginCheck": "Y"}, headers=[
+        ("Set-Cookie", "JSESSIONID={0}; Path=/otn".format(session_id))
+    ])
+
+
+def handle_check_user(handler, state, args, session):
+    handler.send_json({"flag": session is not None})
+
+
+def handle_logout(handler, state, args, session):
+    handler.send_text("")
+
+
+def handle_submit_order(handler, state, args, session):
+    if session is None:
+        handler.send_json(status=False, messages=["用户未登录"])
+        return
+    train_no, issue_time = decode_secret(args.get("secretStr", ""))
+    if train_no not in state.trains or time.time() - issue_time > state.config.secret_ttl:
+        handler.send_json(status=False, messages=[EXPIRED_MESSAGE])
+        return
+    token = uuid.uuid4().hex
+    with state.lock:
+        session["token"] = token
+        state.orders[token] = {"train_no": train_no, "polls": 0, "order_id": None}
+    handler.send_json("N")
+
+
+def handle_init_dc(handler, state, args, session):
+    token = session and session["token"]
+    if token is None:
+        handler.send_text("<html><body>请先登录</body></html>")
+        return
+    handler.send_text(
+        "<!DOCTYPE html><html><head><title>12306</title></head><body>\n"
+        "<script type=\"text/javascript\">\n"
+        "var globalRepeatSubmitToken = '{0}';\n"
+        "var ticketInfoForPassengerForm={{'cardTypes':[],'key_check_isChange':'{1}'}};\n"
+        "</script></body></html>".format(token, token.upper() * 2))
+
+
+def handle_passengers(handler, state, args, session):
+    handler.send_json({"normal_passengers": [{
+        "passenger_name": "测试{0}".format(i + 1),
+        "sex_code": "M",
+        "passenger_id_type_code": "1",
+        "passenger_id_no": "11010119900101{0:04d}".format(i),
+        "passenger_type": "1",
+        "mobile_no": "1380000{0:04d}".format(i)
+    } for i in range(3)]})
+
+
+def get_order(handler, state, args):
+    with state.lock:
+        order = state.orders.get(args.get("REPEAT_SUBMIT_TOKEN"))
+    if order is None:
+        handler.send_json(status=False, messages=["非法请求"])
+    return order
+
+
+def handle_check_order(handler, state, args, session):
+    if get_order(handler, state, args) is not None:
+        handler.send_json({"submitStatus": True})
+
+
+def get_requested_tickets(args):
+    # Seat type ID and passenger count from passengerTicketStr
+    passengers = [p for p in args.get("passengerTicketStr", "").split("_") if p]
+    seat_type = TicketType.REVERSE_ID_LOOKUP.get(passengers[0][0]) if passengers else None
+    return seat_type, max(1, len(passengers))
+
+
+def handle_queue_count(handler, state, args, session):
+    order = get_order(handler, state, args)
+    if order is None:
+        return
+    seat_type = TicketType.REVERSE_ID_LOOKUP.get(args.get("seatType"))
+    with state.lock:
+        count = state.trains[order["train_no"]]["counts"].get(seat_type, 0)
+    handler.send_json({"count": "0", "ticket": str(count), "op_2": "true" if count == 0 else "false",
+                       "countT": "0", "op_1": "false"})
+
+
+def handle_confirm(handler, state, args, session):
+    order = get_order(handler, state, args)
+    if order is None:
+        return
+    seat_type, passenger_count = get_requested_tickets(args)
+    counts = state.trains[order["train_no"]]["counts"]
+    with state.lock:
+        sold = counts.get(seat_type, 0) >= passenger_count
+        if sold:
+            counts[seat_type] -= passenger_count
+    if not sold:
+        handler.send_json({"submitStatus": False, "errMsg": "对不起，由于您取消次数过多，今日将不能继续受理您的订票请求。"
+                           if seat_type is None else "余票不足"})
+        return
+    handler.send_json({"submitStatus": True})
+
+
+def handle_wait_time(handler, state, args, session):
+    order = get_order(handler, state, args)
+    if order is None:
+        return
+    with state.lock:
+        order["polls"] += 1
+        remaining = max(0, state.config.queue_polls - order["polls"])
+        if remaining == 0 and order["order_id"] is None:
+            order["order_id"] = "E{0:09d}".format(state.random.randint(0, 999999999))
+        order_id = order["order_id"]
+    handler.send_json({
+        "queryOrderWaitTimeStatus": True,
+        "count": 0,
+        "waitTime": remaining * 3 if remaining > 0 else -1,
+        "requestId": 0,
+        "waitCount": remaining,
+        "tourFlag": "dc",
+        "orderId": order_id if remaining == 0 else None
+    })
+
+
+def handle_queue_result(handler, state, args, session):
+    if get_order(handler, state, args) is not None:
+        handler.send_json({"submitStatus": True})
+
+
+ROUTES = {
+    "resources/js/framework/station_name.js": handle_station_names,
+    "resources/js/query/train_list.js": handle_train_list,
+    "leftTicket/query": handle_query,
+    "leftTicket/queryTicketPrice": handle_ticket_price,
+    "leftTicketPrice/query": handle_bulk_price,
+    "czxx/queryByTrainNo": handle_train_stops,
+    "queryTrainInfo/query": handle_train_stops,
+    "passcodeNew/getPassCodeNew.do": handle_captcha_image,
+    "passcodeNew/checkRandCodeAnsyn": handle_captcha_check,
+    "login/loginAysnSuggest": handle_login,
+    "login/checkUser": handle_check_user,
+    "login/loginOut": handle_logout,
+    "leftTicket/submitOrderRequest": handle_submit_order,
+    "confirmPassenger/initDc": handle_init_dc,
+    "confirmPassenger/getPassengerDTOs": handle_passengers,
+    "confirmPassenger/checkOrderInfo": handle_check_order,
+    "confirmPassenger/getQueueCount": handle_queue_count,
+    "confirmPassenger/confirmSingleForQueue": handle_confirm,
+    "confirmPassenger/queryOrderWaitTime": handle_wait_time,
+    "confirmPassenger/resultOrderForDcQueue": handle_queue_result
+}
+
+
+class StandinServer:
+    def __init__(self, config=None):
+        self.config = config or StandinConfig()
+        self.state = StandinState(self.config)
+        handler = type("BoundStandinHandler", (StandinHandler,), {"state": self.state})
+        self.__server = ThreadingHTTPServer((self.config.host, self.config.port), handler)
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.__server.server_address[:2]
+        return "http://{0}:{1}/otn/".format(host, port)
+
+    def start(self):
+        # Serves in a background thread; returns the base URL to use
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self.base_url
+
+    def serve_forever(self):
+        self.__server.serve_forever()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local 12306 stand-in server")
+    defaults = StandinConfig()
+    parser.add_argument("--host", default=defaults.host)
+    parser.add_argument("--port", type=int, default=defaults.port)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--trains", type=int, default=defaults.train_count)
+    parser.add_argument("--max-tickets", type=int, default=defaults.max_tickets)
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="milliseconds")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="milliseconds")
+    parser.add_argument("--busy-rate", type=float, default=defaults.busy_rate)
+    parser.add_argument("--http-error-rate", type=float, default=defaults.http_error_rate)
+    parser.add_argument("--sell-rate", type=int, default=defaults.sell_rate)
+    parser.add_argument("--secret-ttl", type=float, default=defaults.secret_ttl)
+    parser.add_argument("--queue-polls", type=int, default=defaults.queue_polls)
+    parser.add_argument("--backends", default="0",
+                        help="comma separated extra latency of each backend, in milliseconds")
+    parser.add_argument("--fixtures")
+    args = parser.parse_args()
+    config = StandinConfig()
+    config.host = args.host
+    config.port = args.port
+    config.seed = args.seed
+    config.train_count = args.trains
+    config.max_tickets = args.max_tickets
+    config.latency = args.latency
+    config.jitter = args.jitter
+    config.busy_rate = args.busy_rate
+    config.http_error_rate = args.http_error_rate
+    config.sell_rate = args.sell_rate
+    config.secret_ttl = args.secret_ttl
+    config.queue_polls = args.queue_polls
+    config.backend_latencies = [float(latency) for latency in args.backends.split(",")]
+    config.fixtures = args.fixtures
+    return config
+
+
+if __name__ == "__main__":
+    server = StandinServer(parse_args())
+    print("Serving 12306 stand-in at " + server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
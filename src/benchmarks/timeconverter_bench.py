@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Measures building the trains of a 100-train query response with the
+# old strptime-based time conversions and the current ones. Usage:
+# python -m benchmarks.timeconverter_bench [iterations]
+import datetime
+import sys
+import timeit
+from core import timeconverter
+from core.data.train import Train
+from core.enums import TicketPricing, TicketType
+from core.jsonwrapper import RootJsonDict
+
+
+class _FakeStation:
+    def __init__(self, station_id, name):
+        self.id = station_id
+        self.name = name
+
+
+def generate_response(train_count=100):
+    # Roughly what leftTicket/query returns; half of the trains
+    # are not on sale yet, which needs the sale time parsed too.
+    abbreviations = list(TicketType.REVERSE_ABBREVIATION_LOOKUP)
+    data = []
+    for i in range(train_count):
+        on_sale = i % 2 == 0
+        query_data = {
+            "station_train_code": "G{0}".format(i + 1),
+            "train_no": "24000000G{0:03d}0C".format(i),
+            "start_time": "{0:02d}:{1:02d}".format(6 + i % 16, (i * 7) % 60),
+            "lishiValue": str(120 + i % 300),
+            "from_station_no": "01",
+            "to_station_no": "05",
+            "canWebBuy": "Y" if on_sale else "N",
+            "start_train_date": "20141201",
+            "location_code": "P2",
+            "yp_info": "",
+            "seat_types": "OM9",
+            "sale_time": "{0:02d}{1:02d}".format(8 + i % 10, (i % 2) * 30),
+            "from_station_telecode": "BJP",
+            "to_station_telecode": "SHH"
+        }
+        for abbreviation in abbreviations:
+            query_data[abbreviation + "_num"] = "--"
+        if on_sale:
+            query_data["yp_info"] = "O055300094M093300011"
+            query_data["ze_num"] = "94"
+            query_data["zy_num"] = "11"
+        else:
+            query_data["ze_num"] = "*"
+            query_data["zy_num"] = "*"
+        data.append({
+            "queryLeftNewDTO": query_data,
+            "secretStr": "MjAxNC0xMi0wMSMwMCNHMTAxIzA0OjQ4IzA3OjAwIzI0MDAwMDBHMTAxMEM=" * 4,
+            "buttonTextInfo": "预订" if on_sale else "12月15日<br/>10点起售"
+        })
+    return RootJsonDict({"status": True, "data": data}, None)["data"]
+
+
+def old_str_to_datetime(date_value, time_value, date_fmt="%Y-%m-%d", time_fmt="%H:%M"):
+    if isinstance(date_value, str):
+        date_value = datetime.datetime.strptime(date_value, date_fmt).date()
+    if isinstance(time_value, str):
+        time_value = datetime.datetime.strptime(time_value, time_fmt).time()
+    return datetime.datetime.combine(date_value, time_value)
+
+
+def old_str_to_time(time_str, fmt="%H:%M"):
+    return datetime.datetime.strptime(time_str, fmt).time()
+
+
+def old_date_to_str(date_obj, fmt="%Y-%m-%d"):
+    return date_obj.strftime(fmt)
+
+
+def build_trains(json_data, train_date):
+    departure = _FakeStation("BJP", "北京")
+    destination = _FakeStation("SHH", "上海")
+    trains = [Train(train_data, departure, destination, TicketPricing.NORMAL, train_date)
+              for train_data in json_data]
+    # Query params for the price lookup of each train
+    for train in trains:
+        timeconverter.date_to_str(train.departure_time)
+    return trains
+
+
+def run(iterations):
+    json_data = generate_response()
+    train_date = datetime.date(2014, 12, 1)
+    current = (timeconverter.str_to_datetime, timeconverter.str_to_time, timeconverter.date_to_str)
+    old = (old_str_to_datetime, old_str_to_time, old_date_to_str)
+    results = {}
+    for name, funcs in (("strptime", old), ("fast paths + memo", current)):
+        timeconverter.str_to_datetime, timeconverter.str_to_time, timeconverter.date_to_str = funcs
+        try:
+            elapsed = timeit.timeit(lambda: build_trains(json_data, train_date), number=iterations)
+            results[name] = [(t.departure_time, t.begin_selling_time) for t in build_trains(json_data, train_date)]
+        finally:
+            timeconverter.str_to_datetime, timeconverter.str_to_time, timeconverter.date_to_str = current
+        print("{0:<20} {1:8.1f} us/response".format(name, elapsed / iterations * 1e6))
+    assert results["strptime"] == results["fast paths + memo"]
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
\ No newline at end of file
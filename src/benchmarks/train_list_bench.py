@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Compares exec()-ing train_list.js against the streaming parser,
+# by parse time and peak memory. Usage:
+# python -m benchmarks.train_list_bench [saved train_list.js] [iterations]
+import datetime
+import re
+import sys
+import timeit
+import tracemalloc
+from core import timeconverter
+from core.search.trainlist import parse_train_list
+
+
+def generate_list(date_count=10, train_count=3000):
+    # Same layout as the real file, with made-up trains
+    start = datetime.date(2014, 12, 1)
+    types = "DGKTZ"
+    trains = [
+        '{{"station_train_code":"{0}{1}(北京-上海)","train_no":"{2:012d}"}}'.format(
+            types[i % len(types)], i, i * 7919)
+        for i in range(train_count)
+    ]
+    dates = []
+    for day in range(date_count):
+        date_str = timeconverter.date_to_str(start + datetime.timedelta(days=day))
+        groups = ",".join('"{0}":[{1}]'.format(t, ",".join(trains[i::len(types)]))
+                          for i, t in enumerate(types))
+        dates.append('"{0}":{{{1}}}'.format(date_str, groups))
+    return ("var train_list ={" + ",".join(dates) + "}").encode("utf-8")
+
+
+def old_parse(content):
+    text = content.decode("utf-8")
+    assert text.startswith("var ")
+    variables = {}
+    exec(text[4:], variables)
+    date_map = {}
+    for train_date_str, type_map in variables["train_list"].items():
+        train_date = timeconverter.str_to_date(train_date_str)
+        train_map = {}
+        for train_type, train_list in type_map.items():
+            for train_obj in train_list:
+                train_name = re.match(r"(.+)\(.*-.*\)", train_obj["station_train_code"]).group(1)
+                train_map[train_name] = train_obj["train_no"]
+        date_map[train_date] = train_map
+    return date_map
+
+
+def new_parse(content, chunk_size=65536):
+    chunks = (content[i:i+chunk_size] for i in range(0, len(content), chunk_size))
+    return parse_train_list(chunks)
+
+
+def peak_memory(func, content):
+    tracemalloc.start()
+    try:
+        result = func(content)
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+def run(content, iterations):
+    assert old_parse(content) == new_parse(content)
+    print("File size: {0:.1f} MB".format(len(content) / 1e6))
+    for name, func in (("exec", old_parse), ("streaming parser", new_parse)):
+        elapsed = timeit.timeit(lambda: func(content), number=iterations)
+        peak, result = peak_memory(func, content)
+        print("{0:<18} {1:8.1f} ms/file {2:8.1f} MB peak".format(
+            name, elapsed / iterations * 1000, peak / 1e6))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+    else:
+        data = generate_list()
+    run(data, int(sys.argv[2]) if len(sys.argv) > 2 else 3)
\ No newline at end of file
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+import time
+from core import logger, metrics
+from core.metrics import MetricsRegistry
+
+
+class BackendStats:
+    def __init__(self, address, alpha):
+        # The decoded backend address (ip:port)
+        self.address = address
+        self.requests = 0
+        self.errors = 0
+        # Exponentially weighted moving averages; alpha is the weight
+        # given to each new sample, so recent behavior dominates.
+        self.latency = None
+        self.error_rate = 0.0
+        self.last_seen_time = None
+        self.__alpha = alpha
+
+    def record(self, latency, error):
+        alpha = self.__alpha
+        self.requests += 1
+        if error:
+            self.errors += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += alpha * (latency - self.latency)
+        self.error_rate += alpha * ((1.0 if error else 0.0) - self.error_rate)
+        self.last_seen_time = time.monotonic()
+
+    def __repr__(self):
+        return "{0} ({1} requests, {2:.0f}ms, {3:.0%} errors)".format(
+            self.address, self.requests, (self.latency or 0) * 1000, self.error_rate)
+
+
+class BackendTable:
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.__backends = {}
+        self.__lock = threading.Lock()
+
+    def record(self, address, latency, error):
+        with self.__lock:
+            stats = self.__backends.get(address)
+            if stats is None:
+                stats = self.__backends[address] = BackendStats(address, self.alpha)
+            stats.record(latency, error)
+        if metrics.ENABLED:
+            registry = MetricsRegistry.instance()
+            registry.histogram("backend_request_seconds", "Request latency by backend server",
+                               backend=address).observe(latency)
+            if error:
+                registry.counter("backend_errors_total", "Failed requests by backend server",
+                                 backend=address).inc()
+        return stats
+
+    def get(self, address):
+        return self.__backends.get(address)
+
+    def __iter__(self):
+        return iter(list(self.__backends.values()))
+
+    def __len__(self):
+        return len(self.__backends)
+
+
+class AffinityPolicy:
+    def __init__(self, table=None):
+        self.table = table or BackendTable()
+        # Don't judge a backend until it has served this many requests
+        self.min_samples = 5
+        # Leave a backend if its error rate goes above this
+        self.max_error_rate = 0.3
+        # Leave a backend if it is this many times slower than the
+        # fastest healthy backend we have seen
+        self.slow_factor = 2.0
+
+    def __is_healthy(self, stats):
+        return stats.requests >= self.min_samples and stats.error_rate <= self.max_error_rate
+
+    def best_backend(self, exclude=None):
+        best = None
+        for stats in self.table:
+            if stats is exclude or not self.__is_healthy(stats):
+                continue
+            if best is None or stats.latency < best.latency:
+                best = stats
+        return best
+
+    def should_leave(self, stats):
+        if stats.requests < self.min_samples:
+            return False
+        if stats.error_rate > self.max_error_rate:
+            return True
+        best = self.best_backend(exclude=stats)
+        return best is not None and stats.latency > best.latency * self.slow_factor
+
+    def record(self, cookies, latency, error):
+        # Called by webrequest after every request made with the
+        # given SessionCookies; attributes the result to the backend
+        # the cookies currently point at, then decides whether to stay.
+        # Leaving means dropping the cookie and letting the load balancer
+        # pick again. Whichever backend that is won't know our session
+        # (or the login and captcha state tied to it), so once we have
+        # one we stay put rather than get logged out mid-purchase.
+        address = cookies.server_address
+        if address is None:
+            return
+        stats = self.table.record(address, latency, error)
+        if cookies.has_session or not self.should_leave(stats):
+            return
+        logger.debug("Dropping backend {0}", stats)
+        cookies.drop_server_cookie()
\ No newline at end of file
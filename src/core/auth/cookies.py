@@ -15,43 +15,215 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
-from requests.cookies import RequestsCookieJar
+import copy
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from http.cookiejar import CookieJar
+from requests.cookies import RequestsCookieJar, create_cookie
 from core import logger
 
 
-class SessionCookies(RequestsCookieJar):
-    def set_cookie(self, cookie, *args, **kwargs):
-        super(SessionCookies, self).set_cookie(cookie)
-        self.__handle_cookie_changed(cookie)
-
-    @classmethod
-    def __handle_cookie_changed(cls, cookie):
-        return {
-            "JSESSIONID": cls.__handle_session_id,
-            "BIGipServerotn": cls.__handle_server_ip
-        }.get(cookie.name, cls.__handle_other_cookie)(cookie)
-
-    @staticmethod
-    def __handle_other_cookie(cookie):
-        pass
-
-    @staticmethod
-    def __handle_session_id(cookie):
-        logger.debug("Got new session ID: " + cookie.value)
-
-    @staticmethod
-    def __handle_server_ip(cookie):
-        logger.debug("Got new server IP: " + cookie.value)
-        # Decoding the server IP for fun (plus it's a security flaw!)
-        # http://support.f5.com/kb/en-us/solutions/public/6000/900/sol6917.html
-        ip_split = cookie.value.split(".")
-        assert len(ip_split) == 3
-        assert ip_split[2] == "0000"
+@functools.lru_cache(maxsize=64)
+def decode_server_address(value):
+    # Decoding the server IP for fun (plus it's a security flaw!)
+    # http://support.f5.com/kb/en-us/solutions/public/6000/900/sol6917.html
+    # Returns "ip:port", or None if the value isn't in the expected format.
+    ip_split = value.split(".")
+    if len(ip_split) != 3 or ip_split[2] != "0000":
+        return None
+    try:
         ip_encoded = int(ip_split[0])
         port_encoded = int(ip_split[1])
-        ip_encoded, ip_0 = divmod(ip_encoded, 256)
-        ip_encoded, ip_1 = divmod(ip_encoded, 256)
-        ip_3, ip_2 = divmod(ip_encoded, 256)
-        port_1, port_0 = divmod(port_encoded, 256)
-        port = port_0 * 256 + port_1
-        logger.debug("Decoded server IP: {}.{}.{}.{}:{}".format(ip_0, ip_1, ip_2, ip_3, port))
\ No newline at end of file
+    except ValueError:
+        return None
+    ip_encoded, ip_0 = divmod(ip_encoded, 256)
+    ip_encoded, ip_1 = divmod(ip_encoded, 256)
+    ip_3, ip_2 = divmod(ip_encoded, 256)
+    port_1, port_0 = divmod(port_encoded, 256)
+    port = port_0 * 256 + port_1
+    return "{}.{}.{}.{}:{}".format(ip_0, ip_1, ip_2, ip_3, port)
+
+
+class SessionCookies(RequestsCookieJar):
+    def __init__(self, *args, **kwargs):
+        super(SessionCookies, self).__init__(*args, **kwargs)
+        # Data that is only valid for the lifetime of the current
+        # server session (e.g. the account's passenger list). This
+        # is cleared whenever the session ID changes.
+        self.session_cache = {}
+        # If set, the cookies are saved to this path whenever they change
+        self.store_path = None
+        # The decoded address of the backend server we're stuck to
+        # (from the BIGipServerotn cookie), or None if unknown
+        self.server_address = None
+        # Requests (and so cookie updates and saves) can come from
+        # several threads at once, e.g. the heartbeat and prefetches
+        self.__lock = threading.RLock()
+        self.__batch_depth = 0
+        self.__dirty = False
+
+    def __get_existing(self, cookie):
+        # The jar is keyed by domain and path, so a match has the same ones
+        return self._cookies.get(cookie.domain, {}).get(cookie.path, {}).get(cookie.name)
+
+    def __is_unchanged(self, cookie):
+        # A refreshed expiry counts as a change too, or the jar (and
+        # the store) would keep the old one and drop the cookie early
+        existing = self.__get_existing(cookie)
+        return existing is not None and \
+            existing.value == cookie.value and \
+            existing.expires == cookie.expires and \
+            existing.secure == cookie.secure
+
+    def set_cookie(self, cookie, *args, **kwargs):
+        with self.__lock:
+            unchanged = self.__is_unchanged(cookie)
+            existing = self.__get_existing(cookie)
+            value_changed = existing is None or existing.value != cookie.value
+            super(SessionCookies, self).set_cookie(cookie)
+            if unchanged:
+                return
+            # Handlers only care about new values, not refreshed expiries
+            handler = self.__cookie_handlers.get(cookie.name)
+            if handler is not None and value_changed:
+                handler(self, cookie)
+            self.__dirty = True
+            if self.__batch_depth == 0:
+                self.__save_if_dirty()
+
+    def update(self, other):
+        # The server sends back most cookies on every response, so
+        # only copy over the ones whose values actually changed.
+        # The store is also only written once for the whole batch.
+        with self.__lock:
+            self.__batch_depth += 1
+            try:
+                if isinstance(other, CookieJar):
+                    for cookie in other:
+                        if not self.__is_unchanged(cookie):
+                            self.set_cookie(copy.copy(cookie))
+                else:
+                    super(SessionCookies, self).update(other)
+            finally:
+                self.__batch_depth -= 1
+            if self.__batch_depth == 0:
+                self.__save_if_dirty()
+
+    def __find_cookie(self, name):
+        for cookie in iter(self):
+            if cookie.name == name:
+                return cookie
+        return None
+
+    @property
+    def has_session(self):
+        # Whether the server has given us a session, which only exists
+        # on the backend that handed it out
+        return self.__find_cookie("JSESSIONID") is not None
+
+    def drop_server_cookie(self):
+        # Lets the load balancer assign us a new backend on the next request
+        with self.__lock:
+            cookie = self.__find_cookie("BIGipServerotn")
+            if cookie is not None:
+                self.clear(cookie.domain, cookie.path, cookie.name)
+                self.server_address = None
+                self.__dirty = True
+                self.__save_if_dirty()
+
+    def __save_if_dirty(self):
+        if self.__dirty and self.store_path is not None:
+            self.save(self.store_path)
+
+    def save(self, path):
+        with self.__lock:
+            now = time.time()
+            data = [{
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "secure": cookie.secure,
+                "expires": cookie.expires
+            } for cookie in self if cookie.expires is None or cookie.expires > now]
+            # Write to a temporary file first so that a crash
+            # can't leave behind a half-written store. mkstemp
+            # gives it a unique name, and (since the store holds
+            # live session credentials) makes it private to us.
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(temp_path, path)
+            except:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+            self.__dirty = False
+
+    def load(self, path):
+        # Returns whether any cookies were loaded
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        now = time.time()
+        loaded = False
+        with self.__lock:
+            self.__batch_depth += 1
+            try:
+                for item in data:
+                    expires = item.get("expires")
+                    if expires is not None and expires <= now:
+                        continue
+                    self.set_cookie(create_cookie(
+                        item["name"], item["value"],
+                        domain=item.get("domain", ""),
+                        path=item.get("path", "/"),
+                        secure=item.get("secure", False),
+                        expires=expires
+                    ))
+                    loaded = True
+            finally:
+                self.__batch_depth -= 1
+            # Nothing new to write back yet
+            self.__dirty = False
+        return loaded
+
+    def reset(self):
+        # Forgets the whole session (e.g. a saved one that turned out
+        # to be stale), including the stored copy
+        with self.__lock:
+            self.clear()
+            self.session_cache.clear()
+            self.server_address = None
+            self.__dirty = True
+            self.__save_if_dirty()
+
+    def attach_store(self, path):
+        # Loads any previously saved cookies from path, and saves
+        # them back there from now on. Returns whether any were loaded.
+        loaded = self.load(path)
+        self.store_path = path
+        return loaded
+
+    def __handle_session_id(self, cookie):
+        self.session_cache.clear()
+        logger.debug("Got new session ID: {0}", cookie.value)
+
+    def __handle_server_ip(self, cookie):
+        self.server_address = decode_server_address(cookie.value)
+        logger.debug("Got new server IP: {0} ({1})", cookie.value, self.server_address)
+
+    # Cookie name -> handler called when that cookie's value changes
+    __cookie_handlers = {
+        "JSESSIONID": __handle_session_id,
+        "BIGipServerotn": __handle_server_ip
+    }
\ No newline at end of file
@@ -18,6 +18,7 @@
 from core import logger, webrequest
 from core.auth.authable import Authable
 from core.jsonwrapper import RequestError
+from core.errorclassifier import ErrorClassifier, MatchType
 
 
 class LoginFailedError(Exception):
@@ -40,6 +41,15 @@ class SystemMaintenanceError(LoginFailedError):
     pass
 
 
+LOGIN_ERRORS = ErrorClassifier([
+    ("登录名不存在!", InvalidUsernameError, MatchType.EXACT),
+    ("密码输入错误", InvalidPasswordError, MatchType.PREFIX),
+    ("您的用户已经被锁定", TooManyLoginAttemptsError, MatchType.PREFIX),
+    ("密码输入次数已超过", TooManyLoginAttemptsError, MatchType.PREFIX),
+    ("系统维护时间", SystemMaintenanceError, MatchType.SUFFIX)
+])
+
+
 class LoginManager(Authable):
     def __init__(self, cookies):
         super(LoginManager, self).__init__(cookies, "login")
@@ -64,18 +74,11 @@ class LoginManager(Authable):
             json = webrequest.post_json(url, data=data, cookies=self.cookies)
             json["data"].assert_true("loginCheck")
         except RequestError as ex:
-            msg = ex.args[0]
-            if msg == "登录名不存在!":
-                raise InvalidUsernameError() from ex
-            if msg.startswith("密码输入错误"):
-                raise InvalidPasswordError() from ex
-            if msg.startswith(("您的用户已经被锁定", "密码输入次数已超过")):
-                raise TooManyLoginAttemptsError() from ex
-            if msg.endswith("系统维护时间"):
-                raise SystemMaintenanceError() from ex
+            LOGIN_ERRORS.raise_for(ex)
             raise
-        logger.debug("Successfully logged in with username: " + username)
+        logger.debug("Successfully logged in with username: {0}", username)
 
     def logout(self):
         webrequest.get("https://kyfw.12306.cn/otn/login/loginOut", cookies=self.cookies, allow_redirects=False)
+        self.cookies.session_cache.clear()
         logger.debug("Successfully logged out")
\ No newline at end of file
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import threading
+import time
+
+
+class QueueTimeoutError(Exception):
+    pass
+
+
+class CancellationToken:
+    def __init__(self):
+        self.__event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.__event.is_set()
+
+    def cancel(self):
+        self.__event.set()
+
+    def wait(self, timeout):
+        # Sleeps for up to timeout seconds, waking up early if the
+        # token is cancelled. Returns whether it was cancelled.
+        return self.__event.wait(timeout)
+
+
+class QueueStatus:
+    def __init__(self, wait_count, wait_time, order_id):
+        # Number of people ahead of us in the queue (None if unknown)
+        self.wait_count = wait_count
+        # The server's estimate (in seconds) of how long we have
+        # to wait. Zero or negative values carry no estimate.
+        self.wait_time = wait_time
+        # The order ID, once the order has gone through
+        self.order_id = order_id
+
+    @property
+    def finished(self):
+        return self.wait_count == 0 and self.order_id is not None
+
+
+class QueueWaiter:
+    def __init__(self, poll, callback=None, token=None):
+        # A function that returns the current QueueStatus
+        self.poll = poll
+        # Optional progress callback, called with the queue length after
+        # every poll that didn't produce an order ID. It is not used
+        # for pacing, so it should return quickly.
+        self.callback = callback
+        # Cancel this token to stop waiting (wait() then returns None)
+        self.token = token or CancellationToken()
+        # Bounds on the delay between polls, in seconds. If the server
+        # gives us a wait time estimate, we poll again around then
+        # (clamped to these bounds); otherwise the delay starts at
+        # min_delay and is multiplied by backoff after every poll.
+        self.min_delay = 0.5
+        self.max_delay = 5.0
+        self.backoff = 2.0
+        # Maximum total time to wait in seconds, or None to wait forever
+        self.deadline = None
+
+    def next_delay(self, attempt, status):
+        if status.wait_time is not None and status.wait_time > 0:
+            delay = status.wait_time
+        else:
+            delay = self.min_delay * (self.backoff ** attempt)
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def __get_sleep_time(self, attempt, status, start_time):
+        delay = self.next_delay(attempt, status)
+        if self.deadline is not None:
+            remaining = self.deadline - (time.monotonic() - start_time)
+            if remaining <= 0:
+                raise QueueTimeoutError()
+            delay = min(delay, remaining)
+        return delay
+
+    def __on_pending(self, status):
+        # wait_count is None if the poll didn't tell us anything new
+        if self.callback is not None and status.wait_count is not None:
+            self.callback(status.wait_count)
+
+    def wait(self):
+        start_time = time.monotonic()
+        attempt = 0
+        while not self.token.cancelled:
+            status = self.poll()
+            if status.finished:
+                return status.order_id
+            self.__on_pending(status)
+            if self.token.wait(self.__get_sleep_time(attempt, status, start_time)):
+                break
+            attempt += 1
+        return None
+
+    async def wait_async(self, loop=None):
+        # Same as wait(), but polls on the event loop's executor
+        # and sleeps without blocking the loop.
+        if loop is None:
+            loop = asyncio.get_running_loop()
+        start_time = time.monotonic()
+        attempt = 0
+        while not self.token.cancelled:
+            status = await loop.run_in_executor(None, self.poll)
+            if status.finished:
+                return status.order_id
+            self.__on_pending(status)
+            delay = self.__get_sleep_time(attempt, status, start_time)
+            # Wake up periodically to notice cancellation
+            while delay > 0 and not self.token.cancelled:
+                step = min(delay, 0.1)
+                await asyncio.sleep(step)
+                delay -= step
+            attempt += 1
+        return None
\ No newline at end of file
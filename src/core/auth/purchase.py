@@ -19,16 +19,18 @@
 # TODO: Return variables required to auto-open the purchase site
 # TODO: Add not-logged-in error
 import re
+import time
 import urllib.parse
-from core import timeconverter, webrequest, logger
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from core import timeconverter, webrequest, logger, tracing
 from core.auth.authable import Authable
+from core.auth.orderqueue import CancellationToken, QueueStatus, QueueWaiter
 from core.enums import TicketPricing, TicketType, TicketStatus
 from core.jsonwrapper import RequestError
+from core.errorclassifier import ErrorClassifier, MatchType
 from core.data.passenger import Passenger
-
-
-class StopPurchaseQueue(Exception):
-    pass
+from core.logger import LogType
 
 
 class PurchaseFailedError(Exception):
@@ -55,11 +57,104 @@ class NotLoggedInError(PurchaseFailedError):
     pass
 
 
+class ServerBusyError(PurchaseFailedError):
+    pass
+
+
+SUBMIT_ORDER_ERRORS = ErrorClassifier([
+    ("您还有未处理的订单", UnfinishedTransactionError, MatchType.PREFIX),
+    ("车票信息已过期", DataExpiredError, MatchType.PREFIX)
+])
+
+QUEUE_POLL_ERRORS = ErrorClassifier([
+    ("系统繁忙", ServerBusyError, MatchType.PREFIX),
+    ("网络繁忙", ServerBusyError, MatchType.PREFIX),
+    ("系统忙", ServerBusyError, MatchType.PREFIX)
+])
+
+
+class PurchasePageScanner:
+    # Both tokens are plain ASCII, so the page can be searched as raw
+    # bytes without decoding it. The trailing quote is part of each
+    # pattern so that a value cut off at a chunk boundary isn't matched.
+    SUBMIT_TOKEN_PATTERN = re.compile(rb"var\s+globalRepeatSubmitToken\s*=\s*['\"]([^'\"]*)['\"]")
+    PURCHASE_KEY_PATTERN = re.compile(rb"['\"]key_check_isChange['\"]\s*:\s*['\"]([^'\"]*)['\"]")
+    # How many bytes to keep between chunks so a match spanning
+    # a chunk boundary is still found (must exceed match length).
+    OVERLAP = 256
+
+    def __init__(self):
+        self.submit_token = None
+        self.purchase_key = None
+        self.__buffer = b""
+
+    @property
+    def done(self):
+        return self.submit_token is not None and self.purchase_key is not None
+
+    def feed(self, chunk):
+        # Returns True once both tokens have been found
+        buffer = self.__buffer + chunk
+        if self.submit_token is None:
+            match = self.SUBMIT_TOKEN_PATTERN.search(buffer)
+            if match is not None:
+                self.submit_token = match.group(1).decode("ascii")
+        if self.purchase_key is None:
+            match = self.PURCHASE_KEY_PATTERN.search(buffer)
+            if match is not None:
+                self.purchase_key = match.group(1).decode("ascii")
+        self.__buffer = buffer[-self.OVERLAP:]
+        return self.done
+
+
+def scan_purchase_page(chunks):
+    # Scans an iterable of byte chunks for the submit token and
+    # purchase key, and stops consuming it once both are found.
+    scanner = PurchasePageScanner()
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    return scanner.submit_token, scanner.purchase_key
+
+
 class TicketSelectionMap:
     # TODO: Implement
     pass
 
 
+class PassengerTemplate:
+    # A passenger pre-encoded into the purchase string formats.
+    # Everything except the seat type is fixed for a given passenger,
+    # so the new-type string is stored as a suffix and completed
+    # (and cached) per seat type.
+    def __init__(self, passenger):
+        self.old_str = "{0},{1},{2},{3}".format(
+            passenger.name,
+            passenger.id_type,
+            passenger.id_number,
+            passenger.type)
+        self.__new_suffix = ",0,{0},{1},{2},{3},{4},N".format(
+            passenger.type,
+            passenger.name,
+            passenger.id_type,
+            passenger.id_number,
+            passenger.phone_number)
+        self.__new_strs = {}
+
+    def new_str(self, seat_type_id):
+        new_str = self.__new_strs.get(seat_type_id)
+        if new_str is None:
+            new_str = self.__new_strs[seat_type_id] = seat_type_id + self.__new_suffix
+        return new_str
+
+
+def get_passenger_template(passenger, templates):
+    template = templates.get(passenger)
+    if template is None:
+        template = templates[passenger] = PassengerTemplate(passenger)
+    return template
+
+
 class PurchaseData:
     def __init__(self, submit_token, purchase_key):
         self.submit_token = submit_token
@@ -67,35 +162,75 @@ class PurchaseData:
         self.ticket_map = None
         self.old_passenger_str = None
         self.new_passenger_str = None
+        self.__encoded_selection = None
 
-    def update_passenger_strs(self):
+    def update_passenger_strs(self, templates=None):
         if self.ticket_map is None or len(self.ticket_map) == 0:
             raise InvalidOperationError("No passengers selected")
+
+        # Retrying with the same selection doesn't need re-encoding
+        selection = tuple((passenger, ticket.type) for passenger, ticket in self.ticket_map.items())
+        if selection == self.__encoded_selection:
+            return
         for ticket in self.ticket_map.values():
             if ticket.status != TicketStatus.NORMAL:
                 raise InvalidOperationError("Invalid ticket selection")
 
-        old_format = "{name},{id_type},{id_no},{passenger_type}"
-        new_format = "{seat_type},0,{ticket_type},{name},{id_type},{id_no},{phone_no},N"
-        format_func = lambda passenger, format_str: format_str.format(
-            name=passenger.name,
-            id_type=passenger.id_type,
-            id_no=passenger.id_number,
-            passenger_type=passenger.type,
-            seat_type=TicketType.ID_LOOKUP[self.ticket_map[passenger].type],
-            ticket_type=passenger.type,
-            phone_no=passenger.phone_number
-        )
-        self.old_passenger_str = "_".join(map(lambda x: format_func(x, old_format), self.ticket_map)) + "_"
-        self.new_passenger_str = "_".join(map(lambda x: format_func(x, new_format), self.ticket_map))
+        if templates is None:
+            templates = {}
+        old_strs = []
+        new_strs = []
+        for passenger, ticket_type in selection:
+            template = get_passenger_template(passenger, templates)
+            old_strs.append(template.old_str)
+            new_strs.append(template.new_str(TicketType.ID_LOOKUP[ticket_type]))
+        self.old_passenger_str = "_".join(old_strs) + "_"
+        self.new_passenger_str = "_".join(new_strs)
+        self.__encoded_selection = selection
+
+
+class PurchaseStepTimer:
+    def __init__(self, timings, step, event_timer):
+        self.timings = timings
+        self.step = step
+        self.event_timer = event_timer
+        self.start = None
+
+    def __enter__(self):
+        self.event_timer.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timings[self.step] = time.perf_counter() - self.start
+        return self.event_timer.__exit__(exc_type, exc_value, traceback)
 
 
 class TicketPurchaser(Authable):
+    # Shared by all purchasers; only used for requests that
+    # don't depend on the response of the preceding step.
+    __executor = ThreadPoolExecutor(max_workers=4)
+
     def __init__(self, cookies):
         super(TicketPurchaser, self).__init__(cookies, "purchase")
         self.pricing = TicketPricing.NORMAL
         self.train = None
+        # Called with the queue length while waiting for the order ID
         self.queue_callback = None
+        # Cancel this to stop waiting for the order ID
+        self.cancel_token = CancellationToken()
+        # Queue polling bounds (seconds); see QueueWaiter
+        self.queue_min_delay = 0.5
+        self.queue_max_delay = 5.0
+        self.queue_deadline = None
+        # Whether to send getQueueCount at the same time as
+        # checkOrderInfo instead of waiting for it to finish. The
+        # website sends these one after the other, so this is off
+        # unless you're feeling lucky.
+        self.parallel_order_checks = False
+        # Step name -> duration in seconds for the last purchase attempt
+        self.step_timings = OrderedDict()
+        self.__passenger_future = None
 
     def __get_purchase_submit_data(self):
         return {
@@ -162,22 +297,26 @@ class TicketPurchaser(Authable):
             "orderSequence_no": order_id
         }
 
+    def __timed_step(self, step):
+        event_timer = logger.timed(LogType.DEBUG, "purchase_step", step=step, train=self.train.name)
+        return PurchaseStepTimer(self.step_timings, step, event_timer)
+
     @staticmethod
     def __get_javascript_date(date):
         return date.strftime("%a %b %d %Y 00:00:00 GMT+0800 (China Standard Time)")
 
-    @staticmethod
-    def __get_submit_token(text):
-        return re.match(".*var\s+globalRepeatSubmitToken\s*=\s*['\"]([^'\"]*).*", text, flags=re.S).group(1)
-
-    @staticmethod
-    def __get_purchase_key(text):
-        return re.match(".*['\"]key_check_isChange['\"]\s*:\s*['\"]([^'\"]*).*", text, flags=re.S).group(1)
-
-    def __get_purchase_page(self):
+    def __get_purchase_tokens(self):
+        # The tokens are near the top of a rather large page, so
+        # stream it and hang up as soon as we have what we need.
         url = "https://kyfw.12306.cn/otn/confirmPassenger/initDc"
-        response = webrequest.post(url, cookies=self.cookies)
-        return response.text
+        response = webrequest.post(url, cookies=self.cookies, stream=True)
+        try:
+            submit_token, purchase_key = scan_purchase_page(response.iter_content(chunk_size=8192))
+        finally:
+            response.close()
+        if submit_token is None or purchase_key is None:
+            raise PurchaseFailedError("Could not find purchase tokens in page")
+        return submit_token, purchase_key
 
     def __submit_order_request(self):
         url = "https://kyfw.12306.cn/otn/leftTicket/submitOrderRequest"
@@ -185,11 +324,7 @@ class TicketPurchaser(Authable):
         try:
             webrequest.post_json(url, data=data, cookies=self.cookies)
         except RequestError as ex:
-            msg = ex.args[0]
-            if msg.startswith("您还有未处理的订单"):
-                raise UnfinishedTransactionError() from ex
-            if msg.startswith("车票信息已过期"):
-                raise DataExpiredError() from ex
+            SUBMIT_ORDER_ERRORS.raise_for(ex)
             raise
 
     def __check_order_info(self, purchase_data):
@@ -207,7 +342,7 @@ class TicketPurchaser(Authable):
             raise NotEnoughTicketsError()
         queue_length = int(json["data"]["countT"])
         if queue_length > 0:
-            logger.debug("{0} people left in queue".format(queue_length))
+            logger.debug("{0} people left in queue", queue_length)
 
     def __confirm_purchase(self, purchase_data):
         url = "https://kyfw.12306.cn/otn/confirmPassenger/confirmSingleForQueue"
@@ -219,16 +354,28 @@ class TicketPurchaser(Authable):
     def __get_queue_data(self, submit_token):
         url = "https://kyfw.12306.cn/otn/confirmPassenger/queryOrderWaitTime"
         params = self.__get_queue_time_params(submit_token)
-        json = webrequest.get_json(url, params=params, cookies=self.cookies)
-        json["data"].assert_true("queryOrderWaitTimeStatus")
-        return json["data"]["waitCount"], json["data"].get("orderId")
-
+        try:
+            json = webrequest.get_json(url, params=params, cookies=self.cookies)
+            json["data"].assert_true("queryOrderWaitTimeStatus")
+        except RequestError as ex:
+            if QUEUE_POLL_ERRORS.classify(ex.args[0]) is not ServerBusyError:
+                raise
+            # Just a hiccup; keep polling, we have no new information
+            logger.debug("Server busy while polling order queue")
+            return QueueStatus(None, None, None)
+        return QueueStatus(json["data"]["waitCount"], json["data"].get("waitTime"), json["data"].get("orderId"))
+
+    def __create_queue_waiter(self, submit_token, callback):
+        waiter = QueueWaiter(lambda: self.__get_queue_data(submit_token), callback, self.cancel_token)
+        waiter.min_delay = self.queue_min_delay
+        waiter.max_delay = self.queue_max_delay
+        waiter.deadline = self.queue_deadline
+        return waiter
+
+    @tracing.traced()
     def __wait_for_queue(self, submit_token, callback):
-        while True:
-            length, order_id = self.__get_queue_data(submit_token)
-            if length == 0 and order_id is not None:
-                return order_id
-            callback(length)
+        # Returns None if cancel_token was cancelled
+        return self.__create_queue_waiter(submit_token, callback).wait()
 
     def __get_queue_result(self, submit_token, order_id):
         url = "https://kyfw.12306.cn/otn/confirmPassenger/resultOrderForDcQueue"
@@ -238,41 +385,109 @@ class TicketPurchaser(Authable):
 
     def __get_order_id(self, submit_token):
         order_id = self.__wait_for_queue(submit_token, self.queue_callback)
-        self.__get_queue_result(submit_token, order_id)
+        if order_id is not None:
+            self.__get_queue_result(submit_token, order_id)
         return order_id
 
-    def get_passenger_list(self):
+    def __fetch_passenger_list(self):
         url = "https://kyfw.12306.cn/otn/confirmPassenger/getPassengerDTOs"
         json = webrequest.post_json(url, cookies=self.cookies)
         passenger_data_list = json["data"]["normal_passengers"]
-        logger.debug("Fetched passenger list ({0} passengers)".format(len(passenger_data_list)))
-        return [Passenger(data) for data in passenger_data_list]
+        logger.debug("Fetched passenger list ({0} passengers)", len(passenger_data_list))
+        passenger_list = [Passenger(data) for data in passenger_data_list]
+        self.cookies.session_cache["passengers"] = passenger_list
+        return passenger_list
+
+    def prefetch_passenger_list(self):
+        # Starts fetching the passenger list in the background, unless
+        # it has already been fetched during the current session.
+        if "passengers" in self.cookies.session_cache:
+            return
+        future = self.__passenger_future
+        if future is None or (future.done() and future.exception() is not None):
+            self.__passenger_future = self.__executor.submit(self.__fetch_passenger_list)
+
+    def __discard_passenger_prefetch(self):
+        # Called when the purchase it was started for fails; the next
+        # attempt (possibly in a new session) must fetch its own list
+        future = self.__passenger_future
+        self.__passenger_future = None
+        if future is not None:
+            future.cancel()
 
+    def get_passenger_list(self):
+        # The passenger list is cached for the lifetime of the session.
+        # The caller gets a copy, since they might modify the list.
+        cached = self.cookies.session_cache.get("passengers")
+        if cached is not None:
+            return list(cached)
+        future = self.__passenger_future
+        self.__passenger_future = None
+        # A prefetch that already failed is stale; only wait on one
+        # that is still running or has a result
+        if future is not None and not (future.done() and future.exception() is not None):
+            with self.__timed_step("passenger_list"):
+                return list(future.result())
+        with self.__timed_step("passenger_list"):
+            return list(self.__fetch_passenger_list())
+
+    def get_passenger_templates(self):
+        # Passenger templates live as long as the passenger list, so
+        # retries within a session only have to join them together.
+        return self.cookies.session_cache.setdefault("passenger_templates", {})
+
+    @tracing.traced()
     def begin_purchase(self):
         if not self.train.can_buy:
             raise InvalidOperationError("No tickets available for purchase")
 
-        logger.debug("Purchasing tickets for train " + self.train.name)
+        logger.debug("Purchasing tickets for train {0}", self.train.name)
+        self.step_timings.clear()
 
-        # Begin purchase
-        self.__submit_order_request()
+        # The passenger list doesn't depend on any of the
+        # following requests, so fetch it while they run.
+        self.prefetch_passenger_list()
 
-        # Parse page for tokens
-        purchase_page = self.__get_purchase_page()
-        submit_token = self.__get_submit_token(purchase_page)
-        purchase_key = self.__get_purchase_key(purchase_page)
+        try:
+            # Begin purchase
+            with self.__timed_step("submit_order_request"):
+                self.__submit_order_request()
+
+            # Parse page for tokens
+            with self.__timed_step("purchase_page"):
+                submit_token, purchase_key = self.__get_purchase_tokens()
+        except:
+            self.__discard_passenger_prefetch()
+            raise
         return PurchaseData(submit_token, purchase_key)
 
+    @tracing.traced()
     @Authable.consumes_captcha()
     def complete_purchase(self, purchase_data):
         # Generate passenger strs
-        purchase_data.update_passenger_strs()
+        with self.__timed_step("passenger_strs"):
+            purchase_data.update_passenger_strs(self.get_passenger_templates())
 
         # Confirm purchase
-        self.__check_order_info(purchase_data)
-        self.__get_queue_count(purchase_data)
-        self.__confirm_purchase(purchase_data)
+        if self.parallel_order_checks:
+            with self.__timed_step("order_checks"):
+                queue_count = self.__executor.submit(self.__get_queue_count, purchase_data)
+                try:
+                    self.__check_order_info(purchase_data)
+                finally:
+                    # Always wait for the other request, even if this one failed
+                    queue_count_error = queue_count.exception()
+                if queue_count_error is not None:
+                    raise queue_count_error
+        else:
+            with self.__timed_step("check_order_info"):
+                self.__check_order_info(purchase_data)
+            with self.__timed_step("queue_count"):
+                self.__get_queue_count(purchase_data)
+        with self.__timed_step("confirm_purchase"):
+            self.__confirm_purchase(purchase_data)
 
         # Wait for order ID
-        order_id = self.__get_order_id(purchase_data.submit_token)
+        with self.__timed_step("wait_for_order"):
+            order_id = self.__get_order_id(purchase_data.submit_token)
         return order_id
\ No newline at end of file
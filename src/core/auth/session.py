@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+import time
+from requests.exceptions import RequestException
+from core import logger
+from core.jsonwrapper import RequestError
+
+
+class SessionManager:
+    def __init__(self, login_manager, interval=60):
+        # The LoginManager whose session is being kept alive
+        self.login_manager = login_manager
+        # Seconds between heartbeats (checkUser requests)
+        self.interval = interval
+        # How long (in seconds) a successful check is trusted for by
+        # ensure_fresh(). This is longer than the heartbeat interval, so
+        # while heartbeats keep succeeding the purchase path never has
+        # to check for itself.
+        self.max_age = interval * 2
+        # Optional function that logs in again when the session has
+        # expired. It returns the LoginManager to use from now on, or
+        # None if logging in failed.
+        self.relogin = None
+        self.session_start_time = time.monotonic()
+        self.last_validated_time = None
+        self.valid = False
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__thread = None
+
+    @property
+    def session_age(self):
+        return time.monotonic() - self.session_start_time
+
+    def mark_valid(self):
+        # Call this after anything that proves the session is
+        # logged in (e.g. a successful login or purchase request).
+        self.valid = True
+        self.last_validated_time = time.monotonic()
+
+    def check(self):
+        # Asks the server whether we are still logged in. Network
+        # errors leave the previous state alone, since they don't
+        # tell us anything about the session itself.
+        with self.__lock:
+            try:
+                logged_in = self.login_manager.is_logged_in()
+            except (RequestException, RequestError) as ex:
+                logger.warning("Session heartbeat failed: {0}", ex)
+                return self.valid
+            if logged_in:
+                self.mark_valid()
+            else:
+                logger.debug("Session has expired (age: {0:.0f}s)", self.session_age)
+                self.valid = False
+            return logged_in
+
+    def ensure_fresh(self, max_age=None):
+        # Returns whether the session is (as far as we know) logged in.
+        # This costs nothing if the session was validated recently;
+        # otherwise it checks with the server and logs in again if needed.
+        if max_age is None:
+            max_age = self.max_age
+        last_validated_time = self.last_validated_time
+        if self.valid and last_validated_time is not None and \
+                time.monotonic() - last_validated_time < max_age:
+            return True
+        if self.check():
+            return True
+        if self.relogin is None:
+            return False
+        # relogin() returns None if it couldn't log in
+        login_manager = self.relogin()
+        if login_manager is None:
+            return False
+        self.login_manager = login_manager
+        self.session_start_time = time.monotonic()
+        self.mark_valid()
+        return True
+
+    def __run(self):
+        while not self.__stop_event.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self.__thread is not None:
+            return
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, name="SessionHeartbeat", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__stop_event.set()
+        self.__thread.join()
+        self.__thread = None
\ No newline at end of file
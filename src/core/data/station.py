@@ -74,7 +74,7 @@ class StationList:
         assert len(js_split) == 3
         station_split = js_split[1].split("@")
         station_list = [Station(item.split("|")) for item in station_split[1:]]
-        logger.debug("Fetched station list ({0} stations)".format(len(station_list)))
+        logger.debug("Fetched station list ({0} stations)", len(station_list))
         cls.__data__ = StationList(station_list, use_dict)
 
     @classmethod
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import threading
+import time
+from collections import OrderedDict
+from core import logger, timeconverter
+
+
+class TimetableStop:
+    def __init__(self, stop_data):
+        # The 1-based index of the stop in the train's station list
+        self.index = int(stop_data["station_no"])
+        # The user-friendly name of the station
+        self.station_name = stop_data["station_name"]
+        # Arrival and departure times (datetime.time); the first stop
+        # has no arrival time and the last one no departure time.
+        self.arrival_time = self.__parse_time(stop_data.get("arrive_time"))
+        self.departure_time = self.__parse_time(stop_data.get("start_time"))
+
+    @staticmethod
+    def __parse_time(value):
+        # Missing times are given as "----"
+        if value is None or ":" not in value:
+            return None
+        return timeconverter.str_to_time(value)
+
+    def __repr__(self):
+        return "{0}. {1} ({2} -> {3})".format(
+            self.index,
+            self.station_name,
+            self.arrival_time and timeconverter.time_to_str(self.arrival_time),
+            self.departure_time and timeconverter.time_to_str(self.departure_time))
+
+
+class Timetable:
+    def __init__(self, train_id, train_date, json_station_list):
+        # The unique internal identifier of the train (e.g. 5l000D220200)
+        self.train_id = train_id
+        # The date the train starts its journey (datetime.date)
+        self.date = train_date
+        # Every stop the train makes, in order
+        self.stops = [TimetableStop(stop_data) for stop_data in json_station_list]
+        self.__name_lookup = {stop.station_name: stop for stop in self.stops}
+
+    def get_stop(self, station_name):
+        return self.__name_lookup.get(station_name)
+
+    def stops_between(self, departure_index, destination_index):
+        # Gets the stops in (departure, destination], by station index
+        return [stop for stop in self.stops if departure_index < stop.index <= destination_index]
+
+    def __iter__(self):
+        return iter(self.stops)
+
+    def __len__(self):
+        return len(self.stops)
+
+
+class TimetableCache:
+    __data__ = None
+
+    def __init__(self, ttl=3600, max_size=256):
+        # How long (in seconds) a timetable is kept before re-fetching
+        self.ttl = ttl
+        # The maximum number of timetables to keep
+        self.max_size = max_size
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        if cls.__data__ is None:
+            cls.__data__ = TimetableCache()
+        return cls.__data__
+
+    def get(self, train_id, train_date):
+        # Returns the cached timetable, or None if missing or expired
+        key = (train_id, train_date)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, timetable):
+        key = (timetable.train_id, timetable.date)
+        with self.__lock:
+            self.__entries[key] = (time.monotonic(), timetable)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def get_or_load(self, train_id, train_date, loader):
+        # loader() is only called (and must return the station list
+        # JSON) if there is no fresh cached timetable.
+        timetable = self.get(train_id, train_date)
+        if timetable is None:
+            timetable = Timetable(train_id, train_date, loader())
+            logger.debug("Parsed timetable for train {0} ({1} stops)", train_id, len(timetable))
+            self.put(timetable)
+        return timetable
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
\ No newline at end of file
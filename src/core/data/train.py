@@ -18,10 +18,36 @@
 import re
 from datetime import datetime, date, timedelta
 from core import logger, timeconverter, webrequest
+from core.logger import LogType
 from core.enums import TrainType, TicketType, TicketStatus
 from core.data.ticket import Ticket, TicketList
 
 
+def parse_ticket_prices(price_data):
+    # Converts a dict of 12306 price fields into {TicketType: price}.
+    # Prices come either as "¥123.5" keyed by the two-character ID
+    # (A1, WZ, ...) or as tenths of a yuan ("01235") keyed by the
+    # one-character ID (1, W, ...).
+    prices = {}
+    for key, value in price_data.items():
+        if not isinstance(value, str) or len(value) < 2:
+            continue
+        if value[0] == "¥" and value[-2] == ".":
+            num_value = float(value[1:])
+            lookup = TicketType.REVERSE_ID2_LOOKUP
+        else:
+            try:
+                num_value = int(value)/10.0
+                lookup = TicketType.REVERSE_ID_LOOKUP
+            except ValueError:
+                continue
+        ticket_type = lookup.get(key)
+        if ticket_type is None:
+            continue
+        prices[ticket_type] = num_value
+    return prices
+
+
 class Train:
     def __init__(self, train_data, departure_station, destination_station, pricing, train_date):
         query_data = train_data["queryLeftNewDTO"]
@@ -159,29 +185,21 @@ class Train:
         ]
 
     def refresh_ticket_prices(self):
-        url = "https://kyfw.12306.cn/otn/leftTicket/queryTicketPrice"
-        params = self.__get_price_query_params()
-        json = webrequest.get_json(url, params=params)
-        for key, value in json["data"].items():
-            if not isinstance(value, str):
-                continue
-            if value[0] == "¥" and value[-2] == ".":
-                num_value = float(value[1:])
-                lookup = TicketType.REVERSE_ID2_LOOKUP
-            else:
-                try:
-                    num_value = int(value)/10.0
-                    lookup = TicketType.REVERSE_ID_LOOKUP
-                except ValueError:
-                    continue
-            ticket_type = lookup.get(key)
-            if ticket_type is None:
-                continue
-            if self.tickets[ticket_type].status == TicketStatus.NOT_APPLICABLE:
+        with logger.timed(LogType.DEBUG, "ticket_prices", endpoint="leftTicket/queryTicketPrice", train=self.name):
+            url = "https://kyfw.12306.cn/otn/leftTicket/queryTicketPrice"
+            params = self.__get_price_query_params()
+            json = webrequest.get_json(url, params=params)
+            self.set_ticket_prices(parse_ticket_prices(json["data"]))
+            logger.debug("Fetched ticket prices for train {0}", self.name)
+
+    def set_ticket_prices(self, prices):
+        # Fills in ticket prices from a {TicketType: price} dict
+        for ticket_type, price in prices.items():
+            ticket = self.tickets[ticket_type]
+            if ticket.status == TicketStatus.NOT_APPLICABLE:
                 continue
-            self.tickets[ticket_type].price = num_value
+            ticket.price = price
         self.ticket_prices_fetched = True
-        logger.debug("Fetched ticket prices for train " + self.name)
 
     def __repr__(self):
         return "{0} (ID: {1}) from {2} to {3} at {4}".format(
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import re
+
+
+class MatchType:
+    EXACT = 0
+    PREFIX = 1
+    SUFFIX = 2
+    CONTAINS = 3
+
+
+class ErrorClassifier:
+    # Maps error messages from the server to exception types. Rules are
+    # given as a table of (pattern, exception type, match type) and are
+    # compiled into a single regex, so classifying a message is one
+    # pass over it no matter how many rules there are. When several
+    # rules match, the one listed first wins.
+    #
+    # The server repeats the same few messages over and over, so
+    # results are also remembered (for up to cache_size messages).
+    def __init__(self, table=(), cache_size=256):
+        self.__rules = []
+        self.__regex = None
+        self.__cache = {}
+        self.cache_size = cache_size
+        for rule in table:
+            self.add(*rule)
+
+    def add(self, pattern, error_type, match_type=MatchType.PREFIX):
+        self.__rules.append((pattern, error_type, match_type))
+        self.__regex = None
+        self.__cache = {}
+
+    def __compile(self):
+        parts = []
+        for i, (pattern, error_type, match_type) in enumerate(self.__rules):
+            pattern = re.escape(pattern)
+            if match_type == MatchType.EXACT:
+                pattern += r"\Z"
+            elif match_type == MatchType.SUFFIX:
+                pattern = ".*" + pattern + r"\Z"
+            elif match_type == MatchType.CONTAINS:
+                pattern = ".*?" + pattern
+            parts.append("(?P<r{0}>{1})".format(i, pattern))
+        return re.compile("|".join(parts) or "(?!)", re.S)
+
+    def classify(self, message):
+        # Returns the exception type for the message, or None
+        if not isinstance(message, str):
+            return None
+        cache = self.__cache
+        try:
+            return cache[message]
+        except KeyError:
+            pass
+        regex = self.__regex
+        if regex is None:
+            regex = self.__regex = self.__compile()
+        match = regex.match(message)
+        error_type = None if match is None else self.__rules[int(match.lastgroup[1:])][1]
+        if len(cache) >= self.cache_size:
+            cache.clear()
+        cache[message] = error_type
+        return error_type
+
+    def raise_for(self, ex):
+        # Raises the classified exception (chained to ex) if the
+        # error's message is recognized; otherwise does nothing.
+        error_type = self.classify(ex.args[0])
+        if error_type is not None:
+            raise error_type() from ex
\ No newline at end of file
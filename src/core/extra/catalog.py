@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import collections
+import sqlite3
+import threading
+from core import logger, timeconverter
+from core.search.trainlist import TrainListParser
+
+
+class TrainCatalog:
+    # An on-disk index of (date, train code) -> train_no, built from
+    # train_list.js. Only the dates that are actually looked up are
+    # pulled into memory (a few at a time), so the process never has
+    # to keep the whole list resident.
+    def __init__(self, path=":memory:", cached_dates=4):
+        self.path = path
+        # The number of per-date lookup tables to keep in memory
+        self.cached_dates = cached_dates
+        self.__date_cache = collections.OrderedDict()
+        self.__lock = threading.RLock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.executescript("""
+            CREATE TABLE IF NOT EXISTS dates (
+                train_date TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS trains (
+                train_date TEXT NOT NULL,
+                train_code TEXT NOT NULL,
+                train_no TEXT NOT NULL,
+                PRIMARY KEY (train_date, train_code)
+            ) WITHOUT ROWID;
+        """)
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+            self.__date_cache.clear()
+
+    def dates(self):
+        with self.__lock:
+            rows = self.__db.execute("SELECT train_date FROM dates ORDER BY train_date").fetchall()
+        return [timeconverter.str_to_date(row[0]) for row in rows]
+
+    def has_date(self, train_date):
+        date_str = timeconverter.date_to_str(train_date)
+        with self.__lock:
+            if date_str in self.__date_cache:
+                return True
+            row = self.__db.execute("SELECT 1 FROM dates WHERE train_date = ?", (date_str,)).fetchone()
+        return row is not None
+
+    def add_dates(self, date_map):
+        # Stores (or replaces) every date in a date -> {code: train_no} map
+        with self.__lock, self.__db:
+            for train_date, train_map in date_map.items():
+                date_str = timeconverter.date_to_str(train_date)
+                self.__db.execute("DELETE FROM trains WHERE train_date = ?", (date_str,))
+                self.__db.executemany(
+                    "INSERT INTO trains (train_date, train_code, train_no) VALUES (?, ?, ?)",
+                    ((date_str, code, train_no) for code, train_no in train_map.items()))
+                self.__db.execute("INSERT OR IGNORE INTO dates (train_date) VALUES (?)", (date_str,))
+                self.__date_cache.pop(date_str, None)
+
+    def remove_before(self, train_date):
+        # Drops dates that can no longer be queried
+        date_str = timeconverter.date_to_str(train_date)
+        with self.__lock, self.__db:
+            self.__db.execute("DELETE FROM trains WHERE train_date < ?", (date_str,))
+            self.__db.execute("DELETE FROM dates WHERE train_date < ?", (date_str,))
+            for cached in [key for key in self.__date_cache if key < date_str]:
+                del self.__date_cache[cached]
+
+    def __get_date_map(self, date_str):
+        cache = self.__date_cache
+        train_map = cache.get(date_str)
+        if train_map is not None:
+            cache.move_to_end(date_str)
+            return train_map
+        rows = self.__db.execute(
+            "SELECT train_code, train_no FROM trains WHERE train_date = ?", (date_str,)).fetchall()
+        train_map = dict(rows)
+        if len(train_map) == 0:
+            # Not caching unknown dates, so has_date() stays accurate
+            return train_map
+        cache[date_str] = train_map
+        if len(cache) > self.cached_dates:
+            cache.popitem(last=False)
+        return train_map
+
+    def get(self, train_date, train_code):
+        # Returns the train_no for a train on a date, or None
+        date_str = timeconverter.date_to_str(train_date)
+        with self.__lock:
+            return self.__get_date_map(date_str).get(train_code)
+
+    def search(self, train_date, prefix, limit=None):
+        # Returns (train code, train_no) pairs whose code starts
+        # with prefix, in code order
+        date_str = timeconverter.date_to_str(train_date)
+        with self.__lock:
+            return self.__db.execute(
+                "SELECT train_code, train_no FROM trains "
+                "WHERE train_date = ? AND train_code >= ? AND train_code < ? "
+                "ORDER BY train_code LIMIT ?",
+                (date_str, prefix, prefix + "\uffff", -1 if limit is None else limit)).fetchall()
+
+    def update(self, chunks):
+        # Adds the dates in a train_list.js stream that aren't in
+        # the catalog yet; dates we already have are skipped without
+        # being parsed. Returns the number of new dates.
+        parser = TrainListParser(skip_dates=set(self.dates()))
+        for chunk in chunks:
+            parser.feed(chunk)
+        new_dates = parser.close()
+        self.add_dates(new_dates)
+        logger.debug("Added {0} dates to train catalog", len(new_dates))
+        return len(new_dates)
\ No newline at end of file
@@ -15,8 +15,10 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
-from core import timeconverter, webrequest
+from core import logger, timeconverter, webrequest
+from core.logger import LogType
 from core.auth.authable import Authable
+from core.data.train import parse_ticket_prices
 
 
 class PriceQuery(Authable):
@@ -35,9 +37,52 @@ class PriceQuery(Authable):
             ("randCode", self.captcha.answer)
         ]
 
+    @staticmethod
+    def __parse_prices(json_data):
+        # Each entry holds one train's prices between the stations it
+        # actually stops at, which (due to the fuzzy station search)
+        # might not be the exact stations that were queried. See
+        # benchmarks/fixtures/leftTicketPrice/query.json for an example.
+        price_map = {}
+        for entry in json_data:
+            price_data = entry.get("queryLeftNewDTO", entry)
+            train_id = price_data.get("train_no")
+            if train_id is None:
+                continue
+            key = (train_id, price_data.get("from_station_telecode"), price_data.get("to_station_telecode"))
+            price_map[key] = parse_ticket_prices(price_data)
+        return price_map
+
     @Authable.consumes_captcha()
     def execute(self):
-        url = "https://kyfw.12306.cn/otn/leftTicketPrice/query"
-        params = self.__get_query_params()
-        json = webrequest.get_json(url, params=params, cookies=self.cookies)
-        # TODO: Complete
\ No newline at end of file
+        # Returns {(train_no, from station ID, to station ID): {TicketType: price}}
+        # for every train between the two stations. The station IDs are
+        # None if the server didn't say which stations the prices are for.
+        with logger.timed(LogType.DEBUG, "bulk_ticket_prices", endpoint="leftTicketPrice/query") as timer:
+            url = "https://kyfw.12306.cn/otn/leftTicketPrice/query"
+            params = self.__get_query_params()
+            json = webrequest.get_json(url, params=params, cookies=self.cookies)
+            price_map = self.__parse_prices(json["data"])
+            timer["trains"] = len(price_map)
+            logger.debug("Fetched ticket prices for {0} trains", len(price_map))
+            return price_map
+
+    @staticmethod
+    def apply_prices(price_map, train_list):
+        # Fills in the ticket prices of the given trains from the
+        # result of execute(), so that they don't each have to query
+        # their own prices. Returns the number of trains updated.
+        updated = 0
+        for train in train_list:
+            prices = price_map.get((train.id, train.departure_station.id, train.destination_station.id))
+            if prices is None:
+                prices = price_map.get((train.id, None, None))
+            if prices is None:
+                continue
+            train.set_ticket_prices(prices)
+            updated += 1
+        return updated
+
+    def refresh_prices(self, train_list):
+        # Prices every train in the list with a single request
+        return self.apply_prices(self.execute(), train_list)
\ No newline at end of file
@@ -15,9 +15,10 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
-import re
 from core import webrequest, timeconverter
 from core.auth.authable import Authable
+from core.extra.catalog import TrainCatalog
+from core.data.timetable import TimetableCache
 
 
 class SingleTrainQuery(Authable):
@@ -28,51 +29,64 @@ class SingleTrainQuery(Authable):
         self.date = None
         self.train_name = None
 
+    # Where the train catalog is stored between runs
+    catalog_path = "train_catalog.db"
+
     @classmethod
     def load_list(cls, local_path=None):
+        # Adds any new dates from train_list.js to the catalog
+        catalog = cls.catalog()
         if local_path is None:
             url = "https://kyfw.12306.cn/otn/resources/js/query/train_list.js"
-            response = webrequest.get(url)
-            text = response.text
+            response = webrequest.get(url, stream=True)
+            try:
+                catalog.update(response.iter_content(65536))
+            finally:
+                response.close()
         else:
-            with open(local_path, "rt", encoding="utf-8") as f:
-                text = f.read()
-
-        # Remove var keyword
-        assert text.startswith("var ")
-        text = text[4:]
-
-        # Execute the JS as Python code
-        variables = {}
-        exec(text, variables)
+            with open(local_path, "rb") as f:
+                catalog.update(iter(lambda: f.read(65536), b""))
 
-        # Load the train data
-        date_map = {}
-        for train_date_str, type_map in variables["train_list"].items():
-            train_date = timeconverter.str_to_date(train_date_str)
-            train_map = {}
-            for train_type, train_list in type_map.items():
-                for train_obj in train_list:
-                    train_id = train_obj["train_no"]
-                    train_name = train_obj["station_train_code"]
-                    train_name = re.match("(.+)\(.*-.*\)", train_name).group(1)
-                    train_map[train_name] = train_id
-            date_map[train_date] = train_map
+    @classmethod
+    def catalog(cls):
+        if cls.__data__ is None:
+            cls.__data__ = TrainCatalog(cls.catalog_path)
+        return cls.__data__
 
-        cls.__data__ = date_map
+    def __get_train_id(self):
+        catalog = self.catalog()
+        train_id = catalog.get(self.date, self.train_name)
+        if train_id is None and not catalog.has_date(self.date):
+            # Only the new dates get downloaded and stored
+            self.load_list()
+            train_id = catalog.get(self.date, self.train_name)
+        if train_id is None:
+            raise KeyError(self.train_name)
+        return train_id
 
     def __get_query_params(self):
         return [
-            ("leftTicketDTO.train_no", self.__data__[self.date][self.train_name]),
+            ("leftTicketDTO.train_no", self.__get_train_id()),
             ("leftTicketDTO.train_date", timeconverter.date_to_str(self.date)),
             ("rand_code", self.captcha.answer)
         ]
 
-    @Authable.consumes_captcha()
-    def execute(self):
-        if self.__data__ is None:
-            self.load_list()
+    def get_cached(self):
+        # Returns the train's timetable if it was already fetched
+        # (here or by path finding), without needing a captcha.
+        train_id = self.catalog().get(self.date, self.train_name)
+        if train_id is None:
+            return None
+        return TimetableCache.instance().get(train_id, self.date)
+
+    def __fetch_station_data(self):
         url = "https://kyfw.12306.cn/otn/queryTrainInfo/query"
         params = self.__get_query_params()
         json = webrequest.get_json(url, params=params, cookies=self.cookies)
-        # TODO: Complete
+        return json["data"]["data"]
+
+    @Authable.consumes_captcha()
+    def execute(self):
+        # Returns the timetable (core.data.timetable.Timetable) of the train
+        train_id = self.__get_train_id()
+        return TimetableCache.instance().get_or_load(train_id, self.date, self.__fetch_station_data)
\ No newline at end of file
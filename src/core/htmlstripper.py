@@ -15,26 +15,23 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import functools
 import html
-from html.parser import HTMLParser
+import re
 
 
-class TagStripper(HTMLParser):
-    def __init__(self):
-        super(TagStripper, self).__init__()
-        self.text = []
-
-    def handle_data(self, d):
-        self.text.append(d)
-
-    def handle_entityref(self, name):
-        self.text.append(html.unescape("&{0};".format(name)))
-
-    def get_data(self):
-        return "".join(self.text)
+# Comments, then tags; a tag that is cut off at the end of the text is
+# dropped as well. A "<" that doesn't start a tag is kept as text.
+__markup_regex = re.compile(r"<!--.*?(?:-->|$)|<[a-zA-Z/!?][^>]*(?:>|$)", re.S)
 
 
+@functools.lru_cache(maxsize=256)
 def strip_html(text):
-    s = TagStripper()
-    s.feed(text)
-    return s.get_data()
\ No newline at end of file
+    # The server only sends a handful of distinct messages (mostly
+    # plain text), so results are cached and plain text skips the
+    # regex entirely.
+    if "<" in text:
+        text = __markup_regex.sub("", text)
+    if "&" in text:
+        text = html.unescape(text)
+    return text
\ No newline at end of file
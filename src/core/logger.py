@@ -16,8 +16,11 @@
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
 from datetime import datetime
+from json.encoder import encode_basestring
+import math
 import os
 import sys
+import time
 
 
 class LogType:
@@ -42,88 +45,300 @@ class LogType:
         "E": ERROR
     }
 
+class OutputFormat:
+    # Human-readable colored text
+    TEXT = 0
+    # One JSON object per line, for feeding into other tools
+    JSON = 1
+
 enabled_log_types = LogType.ALL
+output_format = OutputFormat.TEXT
 print_log_type = True
 print_log_time = False
 
-__colors = {
-    LogType.NONE: lambda s: None,
-    LogType.DEBUG: lambda s: None,
-    LogType.NETWORK: lambda s: None,
-    LogType.WARNING: lambda s: None,
-    LogType.ERROR: lambda s: None
-}
+# Cached per-level switches, kept in sync with enabled_log_types by
+# set_enabled_log_types(). Hot call sites can test these directly
+# (e.g. "if logger.NETWORK_ENABLED:") to avoid building the log
+# arguments at all when the level is disabled.
+DEBUG_ENABLED = True
+NETWORK_ENABLED = True
+WARNING_ENABLED = True
+ERROR_ENABLED = True
+# Whether structured events (see event() and timed()) are written at all.
+# These are only produced in JSON output mode.
+STRUCTURED_ENABLED = False
 
-__streams = {
-    LogType.DEBUG: sys.stdout,
-    LogType.NETWORK: sys.stdout,
-    LogType.WARNING: sys.stdout,
-    LogType.ERROR: sys.stderr
+__enabled = {
+    LogType.DEBUG: True,
+    LogType.NETWORK: True,
+    LogType.WARNING: True,
+    LogType.ERROR: True
 }
 
+__headers = {log_type: "[" + name + "]" for log_type, name in LogType.NAME_LOOKUP.items()}
+
+
+class ConsoleSink:
+    def __init__(self, use_color=None):
+        self.streams = {
+            LogType.DEBUG: sys.stdout,
+            LogType.NETWORK: sys.stdout,
+            LogType.WARNING: sys.stdout,
+            LogType.ERROR: sys.stderr
+        }
+        if use_color is None:
+            use_color = hasattr(sys.stdout, "isatty") and sys.stdout.isatty()
+        self.__ansi_colors = None
+        self.__console_colors = None
+        if use_color and os.name == "posix":
+            self.__ansi_colors = {
+                LogType.DEBUG: "\033[32m",
+                LogType.NETWORK: "\033[35m",
+                LogType.WARNING: "\033[33m",
+                LogType.ERROR: "\033[31m",
+                LogType.NONE: "\033[0m"
+            }
+        elif use_color and os.name == "nt":
+            self.__console_colors = {
+                LogType.DEBUG: 0x02,
+                LogType.NETWORK: 0x05,
+                LogType.WARNING: 0x06,
+                LogType.ERROR: 0x04,
+                LogType.NONE: 0x07
+            }
+
+    def write(self, log_type, line):
+        self.write_batch([(log_type, line)])
+
+    def write_batch(self, entries):
+        if self.__console_colors is not None:
+            # The Windows console can't take colors inline,
+            # so each line still needs its own pair of calls.
+            self.__write_batch_nt(entries)
+            return
 
-if hasattr(sys.stderr, "isatty") and sys.stdout.isatty():
-    if os.name == "nt":
+        # Join each stream's lines (with the color codes embedded)
+        # so that the whole batch costs one write per stream.
+        chunks = {}
+        colors = self.__ansi_colors
+        for log_type, line in entries:
+            stream = self.streams[log_type]
+            chunk = chunks.get(stream)
+            if chunk is None:
+                chunk = chunks[stream] = []
+            if colors is not None:
+                chunk.append(colors[log_type] + line + colors[LogType.NONE])
+            else:
+                chunk.append(line)
+        for stream, chunk in chunks.items():
+            stream.write("\n".join(chunk) + "\n")
+            stream.flush()
+
+    def __write_batch_nt(self, entries):
         import ctypes
-        SetConsoleTextAttribute = ctypes.windll.kernel32.SetConsoleTextAttribute
-        GetStdHandle = ctypes.windll.kernel32.GetStdHandle
-        color = lambda s: SetConsoleTextAttribute(GetStdHandle(-11), s)
-        __colors[LogType.DEBUG] = lambda s: color(0x02)
-        __colors[LogType.NETWORK] = lambda s: color(0x05)
-        __colors[LogType.WARNING] = lambda s: color(0x06)
-        __colors[LogType.ERROR] = lambda s: color(0x04)
-        __colors[LogType.NONE] = lambda s: color(0x07)
-    elif os.name == "posix":
-        __colors[LogType.DEBUG] = lambda s: s.write("\033[32m")
-        __colors[LogType.NETWORK] = lambda s: s.write("\033[35m")
-        __colors[LogType.WARNING] = lambda s: s.write("\033[33m")
-        __colors[LogType.ERROR] = lambda s: s.write("\033[31m")
-        __colors[LogType.NONE] = lambda s: s.write("\033[0m")
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)
+        for log_type, line in entries:
+            stream = self.streams[log_type]
+            kernel32.SetConsoleTextAttribute(handle, self.__console_colors[log_type])
+            stream.write(line + "\n")
+            stream.flush()
+            kernel32.SetConsoleTextAttribute(handle, self.__console_colors[LogType.NONE])
+
+    def flush(self):
+        for stream in set(self.streams.values()):
+            stream.flush()
+
+    def close(self):
+        self.flush()
 
 
-def set_color(log_type):
-    __colors[log_type](__streams[log_type])
+__sink = ConsoleSink()
 
 
-def reset_color(log_type):
-    __colors[LogType.NONE](__streams[log_type])
+def set_sink(sink):
+    # Replaces the log output. A sink is any object with write(log_type, line),
+    # write_batch(entries), flush() and close() methods; see core.logwriter
+    # for file and background-thread sinks. Returns the previous sink.
+    global __sink
+    old_sink = __sink
+    __sink = sink
+    old_sink.flush()
+    return old_sink
+
+
+def get_sink():
+    return __sink
 
 
 def write(log_type, msg):
-    __streams[log_type].write(msg + os.linesep)
+    __sink.write(log_type, msg)
 
 
-def log(log_type, msg, *args, **kwargs):
-    if (enabled_log_types & log_type) != log_type:
-        return
+def set_enabled_log_types(log_types):
+    global enabled_log_types, DEBUG_ENABLED, NETWORK_ENABLED, WARNING_ENABLED, ERROR_ENABLED
+    enabled_log_types = log_types
+    for log_type in __enabled:
+        __enabled[log_type] = (log_types & log_type) == log_type
+    DEBUG_ENABLED = __enabled[LogType.DEBUG]
+    NETWORK_ENABLED = __enabled[LogType.NETWORK]
+    WARNING_ENABLED = __enabled[LogType.WARNING]
+    ERROR_ENABLED = __enabled[LogType.ERROR]
+
+
+def set_output_format(fmt):
+    global output_format, STRUCTURED_ENABLED
+    output_format = fmt
+    STRUCTURED_ENABLED = fmt == OutputFormat.JSON
+
+
+def is_enabled(log_type):
+    return __enabled.get(log_type, False)
+
+
+def format_message(msg, args, kwargs):
+    # Messages are only formatted once we know they will be written.
+    # A callable message is invoked with the log arguments and must
+    # return the final string; otherwise args are applied with format().
+    if callable(msg):
+        return msg(*args, **kwargs)
+    if args or kwargs:
+        return msg.format(*args, **kwargs)
+    return msg
+
+
+def format_line(log_type, msg, args=(), kwargs=None):
+    # Builds the line log() would write for a message, in the
+    # current output format (for sinks that report on their own)
+    formatted = format_message(msg, args, kwargs or {})
+    if output_format == OutputFormat.JSON:
+        return encode_event(LogType.NAME_LOOKUP[log_type], "log", {"msg": formatted})
 
     # Generate log header
-    header = ""
-    if print_log_type:
-        header += "[" + LogType.NAME_LOOKUP[log_type] + "]"
+    header = __headers[log_type] if print_log_type else ""
     if print_log_time:
         header += "[" + datetime.now().strftime("%H:%M:%S") + "]"
+    return header + " " + formatted
 
-    # Lazy evaluate log message for performance reasons
-    if callable(msg):
-        msg = msg()
 
-    set_color(log_type)
-    write(log_type, header + " " + msg.format(*args, **kwargs))
-    reset_color(log_type)
+def log(log_type, msg, *args, **kwargs):
+    if not __enabled.get(log_type, False):
+        return
+    write(log_type, format_line(log_type, msg, args, kwargs))
 
 
 def error(msg, *args, **kwargs):
-    log(LogType.ERROR, msg, *args, **kwargs)
+    if ERROR_ENABLED:
+        log(LogType.ERROR, msg, *args, **kwargs)
+
 
-    
 def warning(msg, *args, **kwargs):
-    log(LogType.WARNING, msg, *args, **kwargs)
+    if WARNING_ENABLED:
+        log(LogType.WARNING, msg, *args, **kwargs)
 
 
 def network(msg, *args, **kwargs):
-    log(LogType.NETWORK, msg, *args, **kwargs)
+    if NETWORK_ENABLED:
+        log(LogType.NETWORK, msg, *args, **kwargs)
 
 
 def debug(msg, *args, **kwargs):
-    log(LogType.DEBUG, msg, *args, **kwargs)
\ No newline at end of file
+    if DEBUG_ENABLED:
+        log(LogType.DEBUG, msg, *args, **kwargs)
+
+
+# Fields that are always written first (when present), so
+# that every line has the same shape for downstream parsers.
+__event_field_order = ("endpoint", "duration", "status", "bytes")
+
+
+def __encode_json_value(value):
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        # NaN and infinity have no JSON representation
+        return repr(value) if math.isfinite(value) else "null"
+    return encode_basestring(str(value))
+
+
+def encode_event(level, event_type, fields):
+    # Hand-rolled encoder: the field set is small and flat,
+    # so this avoids json.dumps' generic machinery and the
+    # intermediate dict that would otherwise be built.
+    parts = [
+        '{"ts":', "{0:.3f}".format(time.time()),
+        ',"level":"', level,
+        '","event":', encode_basestring(event_type)
+    ]
+    for key in __event_field_order:
+        value = fields.get(key)
+        if value is not None:
+            parts.append(',"' + key + '":')
+            parts.append(__encode_json_value(value))
+    for key, value in fields.items():
+        if key in __event_field_order:
+            continue
+        parts.append("," + encode_basestring(key) + ":")
+        parts.append(__encode_json_value(value))
+    parts.append("}")
+    return "".join(parts)
+
+
+def event(log_type, event_type, **fields):
+    if not STRUCTURED_ENABLED or not __enabled.get(log_type, False):
+        return
+    write(log_type, encode_event(LogType.NAME_LOOKUP[log_type], event_type, fields))
+
+
+class EventTimer:
+    def __init__(self, log_type, event_type, fields):
+        self.log_type = log_type
+        self.event_type = event_type
+        self.fields = fields
+        self.start = None
+
+    def __setitem__(self, key, value):
+        self.fields[key] = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Duration is in milliseconds
+        self.fields["duration"] = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.fields.setdefault("status", exc_type.__name__)
+        else:
+            self.fields.setdefault("status", "ok")
+        event(self.log_type, self.event_type, **self.fields)
+        return False
+
+
+class __NullTimer:
+    def __setitem__(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+__null_timer = __NullTimer()
+
+
+def timed(log_type, event_type, **fields):
+    # Usage: with logger.timed(LogType.DEBUG, "step", name="foo") as t: ...
+    # Extra fields can be attached inside the block with t["key"] = value.
+    if not STRUCTURED_ENABLED or not __enabled.get(log_type, False):
+        return __null_timer
+    return EventTimer(log_type, event_type, fields)
\ No newline at end of file
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import atexit
+import os
+import queue
+import threading
+from core import logger
+from core.logger import LogType
+
+
+class OverflowPolicy:
+    # Discard the message being logged
+    DROP_NEWEST = 0
+    # Discard the oldest queued message to make room
+    DROP_OLDEST = 1
+    # Wait for the writer thread to catch up (not recommended
+    # for anything that runs on the request path!)
+    BLOCK = 2
+
+
+class RotatingFileSink:
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=3):
+        # When the file grows past max_bytes, it is renamed to
+        # path.1 (path.1 becomes path.2, etc.) and a new file is
+        # started. At most backup_count old files are kept. A
+        # max_bytes value of 0 disables rotation entirely.
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.__file = open(path, "a", encoding="utf-8")
+        self.__size = self.__file.tell()
+
+    def write(self, log_type, line):
+        self.write_batch([(log_type, line)])
+
+    def write_batch(self, entries):
+        data = "".join(line + "\n" for log_type, line in entries)
+        self.__file.write(data)
+        self.__file.flush()
+        self.__size += len(data.encode("utf-8"))
+        if 0 < self.max_bytes <= self.__size:
+            self.__rotate()
+
+    def __rotate(self):
+        self.__file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = "{0}.{1}".format(self.path, i)
+                if os.path.exists(src):
+                    os.replace(src, "{0}.{1}".format(self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        self.__file = open(self.path, "w", encoding="utf-8")
+        self.__size = 0
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+class MultiSink:
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write(self, log_type, line):
+        self.write_batch([(log_type, line)])
+
+    def write_batch(self, entries):
+        for sink in self.sinks:
+            sink.write_batch(entries)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class AsyncLogWriter:
+    __STOP = object()
+
+    def __init__(self, sinks, max_queue=10000, batch_size=256, overflow=OverflowPolicy.DROP_NEWEST):
+        # Log lines are handed off to a background thread, so the
+        # thread that logs only pays for a queue insertion. The
+        # queue is bounded by max_queue entries; once it fills up,
+        # the overflow policy decides what gets thrown away.
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.dropped = 0
+        self.__queue = queue.Queue(max_queue)
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__run, name="AsyncLogWriter", daemon=True)
+        self.__thread.start()
+        atexit.register(self.close)
+
+    def write(self, log_type, line):
+        if self.__closed:
+            return
+        entry = (log_type, line)
+        if self.overflow == OverflowPolicy.BLOCK:
+            self.__queue.put(entry)
+            return
+        try:
+            self.__queue.put_nowait(entry)
+        except queue.Full:
+            if self.overflow == OverflowPolicy.DROP_OLDEST:
+                try:
+                    self.__queue.get_nowait()
+                    self.__queue.task_done()
+                except queue.Empty:
+                    pass
+                try:
+                    self.__queue.put_nowait(entry)
+                except queue.Full:
+                    pass
+            with self.__queue.mutex:
+                self.dropped += 1
+
+    def write_batch(self, entries):
+        for log_type, line in entries:
+            self.write(log_type, line)
+
+    def __run(self):
+        reported_drops = 0
+        while True:
+            batch = [self.__queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.__queue.get_nowait())
+            except queue.Empty:
+                pass
+            taken = len(batch)
+
+            stop = False
+            for i, entry in enumerate(batch):
+                if entry is self.__STOP:
+                    del batch[i:]
+                    stop = True
+                    break
+
+            with self.__queue.mutex:
+                dropped = self.dropped
+            if dropped != reported_drops:
+                if logger.WARNING_ENABLED:
+                    batch.append((LogType.WARNING, logger.format_line(
+                        LogType.WARNING, "{0} log messages dropped", (dropped - reported_drops,))))
+                reported_drops = dropped
+
+            if len(batch) > 0:
+                for sink in self.sinks:
+                    try:
+                        sink.write_batch(batch)
+                    except Exception:
+                        # There's nowhere sensible left to report this
+                        pass
+            for i in range(taken):
+                self.__queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        # Waits until everything queued so far has been handed to the sinks
+        if not self.__closed:
+            self.__queue.join()
+
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__queue.put(self.__STOP)
+        self.__thread.join()
+        for sink in self.sinks:
+            sink.close()
\ No newline at end of file
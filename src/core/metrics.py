@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import threading
+
+# Set by set_enabled(). Instrumented code checks this
+# before taking any timestamps, so metrics cost nothing
+# unless somebody is actually going to read them.
+ENABLED = False
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = enabled
+
+
+class Counter:
+    TYPE = "counter"
+
+    def __init__(self):
+        self.value = 0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    TYPE = "gauge"
+
+    def __init__(self):
+        self.value = 0
+        self.__lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self.__lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.__lock:
+            self.value -= amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    TYPE = "histogram"
+
+    # Values are stored as integer microseconds in log-linear
+    # buckets (like HdrHistogram): each power of two is split
+    # into HALF_BUCKETS linear sub-buckets, which bounds the
+    # relative error to 1/HALF_BUCKETS without having to know
+    # the value range in advance.
+    PRECISION_BITS = 5
+    SUB_BUCKETS = 1 << PRECISION_BITS
+    HALF_BUCKETS = SUB_BUCKETS >> 1
+
+    def __init__(self, scale=1000000):
+        # scale converts observed values to the integer
+        # unit that is stored (default: seconds -> us)
+        self.scale = scale
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def bucket_index(cls, value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.PRECISION_BITS
+        return cls.SUB_BUCKETS + (shift - 1) * cls.HALF_BUCKETS + (value >> shift) - cls.HALF_BUCKETS
+
+    @classmethod
+    def bucket_upper_bound(cls, index):
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift, mantissa = divmod(index - cls.SUB_BUCKETS, cls.HALF_BUCKETS)
+        shift += 1
+        mantissa += cls.HALF_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def observe(self, value):
+        scaled = int(value * self.scale)
+        if scaled < 0:
+            scaled = 0
+        index = self.bucket_index(scaled)
+        with self.__lock:
+            self.__buckets[index] = self.__buckets.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        # Returns the upper bound of the bucket containing
+        # the given percentile, in the observed unit.
+        with self.__lock:
+            if self.count == 0:
+                return None
+            target = max(1, int(round(self.count * percent / 100.0)))
+            seen = 0
+            for index in sorted(self.__buckets):
+                seen += self.__buckets[index]
+                if seen >= target:
+                    return self.bucket_upper_bound(index) / self.scale
+            return self.max
+
+    def samples(self, name, labels):
+        with self.__lock:
+            buckets = sorted(self.__buckets.items())
+            count = self.count
+            total = self.sum
+        cumulative = 0
+        for index, bucket_count in buckets:
+            cumulative += bucket_count
+            le = "{0:.6g}".format(self.bucket_upper_bound(index) / self.scale)
+            yield name + "_bucket", labels + (("le", le),), cumulative
+        yield name + "_bucket", labels + (("le", "+Inf"),), count
+        yield name + "_sum", labels, total
+        yield name + "_count", labels, count
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99)
+        }
+
+
+class MetricsRegistry:
+    __data__ = None
+
+    def __init__(self):
+        # name -> (metric class, help text, {label tuple -> metric})
+        self.__families = {}
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        if cls.__data__ is None:
+            cls.__data__ = MetricsRegistry()
+        return cls.__data__
+
+    def __get(self, metric_cls, name, help_text, labels):
+        label_key = tuple(sorted(labels.items()))
+        family = self.__families.get(name)
+        if family is not None:
+            metric = family[2].get(label_key)
+            if metric is not None:
+                return metric
+        with self.__lock:
+            family = self.__families.get(name)
+            if family is None:
+                family = self.__families[name] = (metric_cls, help_text, {})
+            elif family[0] is not metric_cls:
+                raise TypeError("Metric {0} is already registered as a {1}".format(name, family[0].TYPE))
+            metric = family[2].get(label_key)
+            if metric is None:
+                metric = family[2][label_key] = metric_cls()
+            return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self.__get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", **labels):
+        return self.__get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text="", **labels):
+        return self.__get(Histogram, name, help_text, labels)
+
+    def __copy_families(self):
+        # New label sets can be registered by other threads while we
+        # read, so take a consistent copy of both levels first
+        with self.__lock:
+            return [(name, metric_cls, help_text, list(metrics.items()))
+                    for name, (metric_cls, help_text, metrics) in self.__families.items()]
+
+    def snapshot(self):
+        # Returns {name: {label tuple: value}} for in-process consumers
+        return {
+            name: {labels: metric.snapshot() for labels, metric in metrics}
+            for name, metric_cls, help_text, metrics in self.__copy_families()
+        }
+
+    def clear(self):
+        with self.__lock:
+            self.__families.clear()
+
+    @staticmethod
+    def __format_labels(labels):
+        if len(labels) == 0:
+            return ""
+        return "{" + ",".join('{0}="{1}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                              for k, v in labels) + "}"
+
+    def to_prometheus(self):
+        lines = []
+        for name, metric_cls, help_text, metrics in sorted(self.__copy_families(), key=lambda family: family[0]):
+            if help_text:
+                lines.append("# HELP {0} {1}".format(name, help_text))
+            lines.append("# TYPE {0} {1}".format(name, metric_cls.TYPE))
+            for labels, metric in sorted(metrics, key=lambda item: item[0]):
+                for sample_name, sample_labels, value in metric.samples(name, labels):
+                    lines.append("{0}{1} {2}".format(sample_name, self.__format_labels(sample_labels), value))
+        return "\n".join(lines) + "\n"
+
+    def dump_prometheus(self, path):
+        # Write to a temporary file first so that a scraper
+        # never sees a half-written file.
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
\ No newline at end of file
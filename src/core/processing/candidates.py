@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import heapq
+from core.enums import TicketType, TicketStatus
+
+
+# Seat types in the order they are tried when no preference is given
+DEFAULT_SEAT_PREFERENCES = [
+    TicketType.HARD_SEAT,
+    TicketType.SOFT_SEAT,
+    TicketType.HARD_SLEEPER,
+    TicketType.SOFT_SLEEPER,
+    TicketType.SOFT_SLEEPER_PRO,
+    TicketType.SECOND_CLASS,
+    TicketType.FIRST_CLASS,
+    TicketType.SPECIAL,
+    TicketType.BUSINESS,
+    TicketType.NO_SEAT,
+    TicketType.OTHER
+]
+
+
+class PurchaseCandidate:
+    def __init__(self, train, ticket_type):
+        # The train to buy tickets for
+        self.train = train
+        # The seat type to buy (from TicketType enum)
+        self.ticket_type = ticket_type
+        # (train rank, seat rank), lower is better
+        self.rank = None
+        # Set once a purchase attempt with this candidate has failed
+        self.failed = False
+
+    @property
+    def ticket(self):
+        return self.train.tickets[self.ticket_type]
+
+    def __lt__(self, other):
+        return self.rank < other.rank
+
+    def __repr__(self):
+        return "{0} ({1})".format(self.train.name, TicketType.FULL_NAME_LOOKUP[self.ticket_type])
+
+
+class CandidateQueue:
+    # A ranked queue of (train, seat type) pairs to try buying, best
+    # first. Trains are ranked by their position in the (already
+    # sorted) train list, then by seat preference within each train.
+    #
+    # When a new train list arrives, only the trains whose ticket
+    # data changed are re-evaluated; candidates for the others (and
+    # whether they already failed) are kept as they were.
+    def __init__(self, seat_preferences=None, ticket_filter=None):
+        if seat_preferences is None:
+            seat_preferences = DEFAULT_SEAT_PREFERENCES
+        self.seat_preferences = list(seat_preferences)
+        # Optional TicketFilter that seat types must also pass
+        self.ticket_filter = ticket_filter
+        # The number of tickets each candidate must have left
+        self.min_count = 1
+        # train ID -> (ticket signature, [candidates])
+        self.__trains = {}
+        self.__heap = []
+
+    @staticmethod
+    def __get_signature(train):
+        return train.can_buy, tuple((ticket.status, ticket.count) for ticket in train.tickets)
+
+    def __is_viable(self, ticket):
+        if ticket.status != TicketStatus.NORMAL or ticket.count < self.min_count:
+            return False
+        return self.ticket_filter is None or self.ticket_filter.check(ticket)
+
+    def __create_candidates(self, train):
+        if not train.can_buy:
+            return []
+        return [PurchaseCandidate(train, ticket_type)
+                for ticket_type in self.seat_preferences
+                if self.__is_viable(train.tickets[ticket_type])]
+
+    def __update_train(self, train):
+        # Reuses the existing candidates if the train's tickets look the
+        # same as before, otherwise builds new ones. Returns the list.
+        signature = self.__get_signature(train)
+        entry = self.__trains.get(train.id)
+        if entry is not None and entry[0] == signature:
+            candidates = entry[1]
+            for candidate in candidates:
+                # Always hold on to the newest train object, since
+                # the old one's secret key might have expired
+                candidate.train = train
+        else:
+            candidates = self.__create_candidates(train)
+            self.__trains[train.id] = (signature, candidates)
+        return candidates
+
+    def update(self, train_list):
+        # Applies a newly queried (filtered and sorted) train list
+        seen = set()
+        heap = []
+        for train_rank, train in enumerate(train_list):
+            seen.add(train.id)
+            for seat_rank, candidate in enumerate(self.__update_train(train)):
+                candidate.rank = (train_rank, seat_rank)
+                if not candidate.failed:
+                    heap.append(candidate)
+        for train_id in list(self.__trains):
+            if train_id not in seen:
+                del self.__trains[train_id]
+        heapq.heapify(heap)
+        self.__heap = heap
+
+    def replace_train(self, train):
+        # Updates a single train (e.g. after re-querying it) in place,
+        # keeping its rank. Returns False if the train isn't queued.
+        entry = self.__trains.get(train.id)
+        if entry is None or len(entry[1]) == 0:
+            return False
+        rank = entry[1][0].rank[0]
+        candidates = self.__update_train(train)
+        for seat_rank, candidate in enumerate(candidates):
+            if candidate.rank is None:
+                candidate.rank = (rank, seat_rank)
+                heapq.heappush(self.__heap, candidate)
+        return True
+
+    def mark_failed(self, candidate):
+        # Skips the candidate until its train's tickets change
+        candidate.failed = True
+
+    def pop(self):
+        # Returns the best candidate that hasn't failed, or None
+        heap = self.__heap
+        while len(heap) > 0:
+            candidate = heapq.heappop(heap)
+            if candidate.failed:
+                continue
+            entry = self.__trains.get(candidate.train.id)
+            if entry is None or candidate not in entry[1]:
+                # Stale; the train was replaced since this was queued
+                continue
+            return candidate
+        return None
+
+    def push(self, candidate):
+        # Puts a popped candidate back, e.g. to retry it
+        heapq.heappush(self.__heap, candidate)
+
+    def __len__(self):
+        return sum(1 for candidate in self.__heap if not candidate.failed)
\ No newline at end of file
@@ -21,6 +21,7 @@ from datetime import datetime, timedelta
 from collections import OrderedDict
 from core import timeconverter, logger, webrequest
 from core.data.station import StationList
+from core.data.timetable import TimetableCache
 from core.search.search import TrainQuery, TicketPricing
 from core.processing.containers import ValueRange, FlagSet
 
@@ -92,9 +93,14 @@ class PathFinder:
             # Apparently you're not supposed to use the actual
             # train date here, not the date returned in the
             # train query data. And yes, they can be different.
-            ("depart_date", timeconverter.date_to_str(train.data["alt_date"]).strftime("%Y%m%d"))
+            ("depart_date", timeconverter.date_to_str(PathFinder.__get_start_date(train)))
         ]
 
+    @staticmethod
+    def __get_start_date(train):
+        # The date the train leaves its first station (YYYYMMDD)
+        return timeconverter.str_to_date(train.data["alt_date"], "%Y%m%d")
+
     @staticmethod
     def __get_dates_between(date_start, date_end):
         if isinstance(date_start, datetime):
@@ -104,32 +110,42 @@ class PathFinder:
         for i in range((date_end - date_start).days + 1):
             yield date_start + timedelta(days=i)
 
-    def __get_substations(self, train):
-        # Gets stations in (train.departure, train.destination]
+    def __fetch_station_data(self, train):
         url = "https://kyfw.12306.cn/otn/czxx/queryByTrainNo"
         params = self.__get_train_data_query_params(train)
         json = webrequest.get_json(url, params=params)
-        json_station_list = json["data"]["data"]
-        logger.debug("Fetched station data for train " + train.name)
-        istart = None
-        iend = len(json_station_list)
-        for i in range(len(json_station_list)):
-            is_in_path = json_station_list[i]["isEnabled"]
-            if is_in_path and istart is None:
-                istart = i
-            elif not is_in_path and istart is not None:
-                iend = i
-                break
-        assert istart is not None
-        assert json_station_list[istart]["station_name"] == train.departure_station.name
-        assert json_station_list[iend-1]["station_name"] == train.destination_station.name
+        logger.debug("Fetched station data for train {0}", train.name)
+        return json["data"]["data"]
+
+    def __get_substations(self, train):
+        # Gets stations in (train.departure, train.destination]
+        timetable = TimetableCache.instance().get_or_load(
+            train.id, self.__get_start_date(train), lambda: self.__fetch_station_data(train))
+        departure_stop = timetable.get_stop(train.departure_station.name)
+        destination_stop = timetable.get_stop(train.destination_station.name)
+        if departure_stop is None or destination_stop is None:
+            # Incomplete timetable, so we can't tell where the train
+            # stops in between; only consider riding it all the way.
+            logger.debug("Timetable for train {0} is missing {1} or {2}",
+                         train.name, train.departure_station.name, train.destination_station.name)
+            return [train.destination_station]
+        departure_index = int(train.departure_index)
+        destination_index = int(train.destination_index)
+        if departure_stop.index != departure_index or destination_stop.index != destination_index:
+            # The station names are what the rest of the search goes
+            # by, so trust them over the indexes in the query data
+            logger.debug("Station indexes of train {0} don't match its timetable", train.name)
+            departure_index = departure_stop.index
+            destination_index = destination_stop.index
+        stops = timetable.stops_between(departure_index, destination_index)
+        if len(stops) == 0:
+            return [train.destination_station]
         available_stations = []
         station_list = StationList.instance()
-        for i in range(istart+1, iend-1):
-            station_name = json_station_list[i]["station_name"]
-            if self.station_blacklist[station_name]:
+        for stop in stops[:-1]:
+            if self.station_blacklist[stop.station_name]:
                 continue
-            station = station_list.get_by_name(station_name)
+            station = station_list.get_by_name(stop.station_name)
             available_stations.append(station)
         available_stations.append(train.destination_station)
         return available_stations
@@ -203,8 +219,8 @@ class PathFinder:
         # Oh no, there is no way to get from our current station to
         # the target destination station!
         if len(next_train_dict) == 0:
-            logger.debug("No trains found in sub-path from {0} to {1}".format(
-                departure_station.name, last_station.name))
+            logger.debug("No trains found in sub-path from {0} to {1}",
+                         departure_station.name, last_station.name)
             # Let the client handle no-result cases
             # return None
 
@@ -242,8 +258,8 @@ class PathFinder:
             if next_search is not None:
                 return next_search
 
-            logger.debug("Undoing from {0} to {1}".format(
-                query.departure_station.name, departure_station.name))
+            logger.debug("Undoing from {0} to {1}",
+                         query.departure_station.name, departure_station.name)
 
     def get_path(self, train):
         query = TrainQuery()
@@ -15,10 +15,14 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+from requests.exceptions import RequestException
 from core import logger, timeconverter, webrequest
+from core.logger import LogType
+from core.auth.authable import CaptchaUnsolvedError
 from core.data.station import StationList
 from core.enums import TicketPricing
 from core.jsonwrapper import RequestError
+from core.errorclassifier import ErrorClassifier, MatchType
 from core.data.train import Train
 
 
@@ -30,6 +34,11 @@ class DateOutOfRangeError(SearchFailedError):
     pass
 
 
+QUERY_ERRORS = ErrorClassifier([
+    ("选择的查询日期不在预售日期范围内", DateOutOfRangeError, MatchType.EXACT)
+])
+
+
 class TrainQuery:
     def __init__(self):
         # The type of ticket pricing -- normal ("adult") or student
@@ -52,30 +61,118 @@ class TrainQuery:
             ("purpose_codes", TicketPricing.SEARCH_LOOKUP[self.pricing])
         ]
 
-    def execute(self):
+    def __fetch_train_data(self):
         url = "https://kyfw.12306.cn/otn/leftTicket/query"
         params = self.__get_query_params()
         json = webrequest.get_json(url, params=params)
         try:
             json_data = json["data"]
         except RequestError as ex:
-            if ex.args[0] == "选择的查询日期不在预售日期范围内":
-                raise DateOutOfRangeError() from ex
+            QUERY_ERRORS.raise_for(ex)
             raise
-        logger.debug("Got train list from {0} to {1} on {2}".format(
-            self.departure_station.name,
-            self.destination_station.name,
-            timeconverter.date_to_str(self.date)))
-        train_list = []
-        station_list = StationList.instance()
-        for train_data in json_data:
-            query_data = train_data["queryLeftNewDTO"]
-            departure_station = station_list.get_by_id(query_data["from_station_telecode"])
-            destination_station = station_list.get_by_id(query_data["to_station_telecode"])
-            if self.exact_departure_station and departure_station != self.departure_station:
-                continue
-            if self.exact_destination_station and destination_station != self.destination_station:
-                continue
-            train = Train(train_data, departure_station, destination_station, self.pricing, self.date)
-            train_list.append(train)
-        return train_list
\ No newline at end of file
+        logger.debug("Got train list from {0} to {1} on {2}",
+                     self.departure_station.name,
+                     self.destination_station.name,
+                     self.date)
+        return json_data
+
+    def __create_train(self, train_data, station_list):
+        query_data = train_data["queryLeftNewDTO"]
+        departure_station = station_list.get_by_id(query_data["from_station_telecode"])
+        destination_station = station_list.get_by_id(query_data["to_station_telecode"])
+        if self.exact_departure_station and departure_station != self.departure_station:
+            return None
+        if self.exact_destination_station and destination_station != self.destination_station:
+            return None
+        return Train(train_data, departure_station, destination_station, self.pricing, self.date)
+
+    def execute(self):
+        with logger.timed(LogType.DEBUG, "train_query", endpoint="leftTicket/query") as timer:
+            json_data = self.__fetch_train_data()
+            train_list = []
+            station_list = StationList.instance()
+            for train_data in json_data:
+                train = self.__create_train(train_data, station_list)
+                if train is not None:
+                    train_list.append(train)
+            timer["trains"] = len(train_list)
+            return train_list
+
+    def find_train(self, train_id):
+        # Re-runs the query, but only builds the train with the given
+        # ID (e.g. to get a new secret key once the old one expires).
+        # Returns None if the train is no longer in the results.
+        with logger.timed(LogType.DEBUG, "train_query", endpoint="leftTicket/query", train=train_id):
+            json_data = self.__fetch_train_data()
+            station_list = StationList.instance()
+            for train_data in json_data:
+                if train_data["queryLeftNewDTO"]["train_no"] == train_id:
+                    return self.__create_train(train_data, station_list)
+            return None
+
+
+class TrainSearch:
+    # A query together with the filter and sorter applied to its
+    # results. These are built once and reused for every search
+    # (and every retry) instead of being rebuilt each time.
+    def __init__(self, query, train_filter=None, train_sorter=None):
+        self.query = query
+        self.filter = train_filter
+        self.sorter = train_sorter
+        # Optional func(train_list) -> void hooks from the user
+        self.custom_filter = None
+        self.custom_sorter = None
+        # Optional core.extra.pricing.PriceQuery. If set, apply() prices
+        # the trains with one bulk request before filtering and sorting,
+        # instead of one request per train as Ticket.price is first read.
+        self.price_query = None
+        # Optional func(captcha) that answers the price query's captcha
+        self.captcha_solver = None
+        # Prices don't change between searches, so bulk results are
+        # kept and only fetched again for trains we haven't tried yet
+        self.__price_map = {}
+        self.__priced_ids = set()
+
+    def __fetch_prices(self, train_list):
+        price_query = self.price_query
+        unpriced = [train for train in train_list if not train.ticket_prices_fetched]
+        price_query.apply_prices(self.__price_map, unpriced)
+        unpriced = [train for train in unpriced if not train.ticket_prices_fetched]
+        if all(train.id in self.__priced_ids for train in unpriced):
+            # Anything left wasn't in an earlier bulk response, and
+            # gets priced one train at a time
+            return
+        self.__priced_ids.update(train.id for train in unpriced)
+        price_query.date = self.query.date
+        price_query.departure_station = self.query.departure_station
+        price_query.destination_station = self.query.destination_station
+        try:
+            if price_query.captcha.answer is None and self.captcha_solver is not None:
+                self.captcha_solver(price_query.captcha)
+            self.__price_map.update(price_query.execute())
+        except (CaptchaUnsolvedError, RequestError, RequestException) as ex:
+            logger.warning("Bulk price query failed, pricing trains one at a time: {0!r}", ex)
+            return
+        price_query.apply_prices(self.__price_map, unpriced)
+
+    def apply(self, train_list):
+        # Returns the trains that pass the filters, best first
+        if self.price_query is not None:
+            self.__fetch_prices(train_list)
+        if self.filter is not None:
+            train_list = self.filter.filter(train_list)
+        if self.custom_filter is not None:
+            self.custom_filter(train_list)
+        if self.sorter is not None:
+            self.sorter.sort(train_list)
+        if self.custom_sorter is not None:
+            self.custom_sorter(train_list)
+        return train_list
+
+    def refresh_train(self, train):
+        # Gets an up-to-date copy of a single train, or None if the
+        # train is gone or no longer passes the filters.
+        new_train = self.query.find_train(train.id)
+        if new_train is None or len(self.apply([new_train])) == 0:
+            return None
+        return new_train
\ No newline at end of file
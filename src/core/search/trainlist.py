@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import re
+import sys
+from core import timeconverter
+
+
+class TrainListParser:
+    # Incrementally scans train_list.js, which looks like this:
+    #
+    # var train_list ={"2014-12-01":{"D":[{"station_train_code":"D1(北京-沈阳)",
+    #   "train_no":"24000000D10R"},...],"T":[...]},"2014-12-02":{...}}
+    #
+    # Rather than evaluating the whole thing, we only look for date
+    # keys and the innermost train objects, so the file can be parsed
+    # as it downloads and never has to be held in memory at once.
+    __token_regex = re.compile(rb'"(\d{4}-\d{2}-\d{2})"\s*:|\{([^{}]*)\}')
+    __code_regex = re.compile(rb'"station_train_code"\s*:\s*"([^"(]*)')
+    __id_regex = re.compile(rb'"train_no"\s*:\s*"([^"]*)"')
+
+    def __init__(self, skip_dates=None):
+        # date -> {train code: train_no}
+        self.dates = {}
+        # Dates whose trains should not be collected
+        self.skip_dates = skip_dates or set()
+        self.__train_map = None
+        self.__buffer = b""
+
+    def __parse(self, data):
+        train_map = self.__train_map
+        code_regex = self.__code_regex
+        id_regex = self.__id_regex
+        for match in self.__token_regex.finditer(data):
+            date_str, train_obj = match.groups()
+            if date_str is not None:
+                train_date = timeconverter.str_to_date(date_str.decode("ascii"))
+                if train_date in self.skip_dates:
+                    train_map = None
+                else:
+                    train_map = self.dates.setdefault(train_date, {})
+                continue
+            if train_map is None:
+                continue
+            code_match = code_regex.search(train_obj)
+            id_match = id_regex.search(train_obj)
+            if code_match is None or id_match is None:
+                continue
+            # The same trains show up under every date, so share
+            # the strings instead of keeping a copy per date.
+            train_code = sys.intern(code_match.group(1).decode("utf-8"))
+            train_map[train_code] = sys.intern(id_match.group(1).decode("utf-8"))
+        self.__train_map = train_map
+
+    def feed(self, chunk):
+        # Tokens never contain a closing brace, so everything up to
+        # the last one in the buffer can be parsed right away.
+        data = self.__buffer + chunk
+        end = data.rfind(b"}") + 1
+        if end == 0:
+            self.__buffer = data
+            return
+        self.__parse(data[:end])
+        self.__buffer = data[end:]
+
+    def close(self):
+        if len(self.__buffer) > 0:
+            self.__parse(self.__buffer)
+            self.__buffer = b""
+        return self.dates
+
+
+def parse_train_list(chunks):
+    parser = TrainListParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
\ No newline at end of file
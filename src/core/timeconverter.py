@@ -16,7 +16,92 @@
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
 
-from datetime import datetime
+import functools
+from datetime import datetime, date, time
+
+# 12306 only ever sends a handful of fixed formats, and mostly the same
+# few values (one date per query, a few hundred distinct times), so the
+# known formats are parsed by hand and all results are memoized. Other
+# formats still go through strptime.
+
+
+def __parse_int(value, start, end):
+    digits = value[start:end]
+    if not digits.isdigit() or not digits.isascii():
+        raise ValueError(value)
+    return int(digits)
+
+
+def __parse_ymd(value):
+    # %Y-%m-%d
+    if len(value) != 10 or value[4] != "-" or value[7] != "-":
+        raise ValueError(value)
+    return date(__parse_int(value, 0, 4), __parse_int(value, 5, 7), __parse_int(value, 8, 10))
+
+
+def __parse_ymd_compact(value):
+    # %Y%m%d
+    if len(value) != 8:
+        raise ValueError(value)
+    return date(__parse_int(value, 0, 4), __parse_int(value, 4, 6), __parse_int(value, 6, 8))
+
+
+def __parse_hm(value):
+    # %H:%M
+    if len(value) != 5 or value[2] != ":":
+        raise ValueError(value)
+    return time(__parse_int(value, 0, 2), __parse_int(value, 3, 5))
+
+
+def __parse_hm_compact(value):
+    # %H%M
+    if len(value) != 4:
+        raise ValueError(value)
+    return time(__parse_int(value, 0, 2), __parse_int(value, 2, 4))
+
+
+__date_parsers = {
+    "%Y-%m-%d": __parse_ymd,
+    "%Y%m%d": __parse_ymd_compact
+}
+
+__time_parsers = {
+    "%H:%M": __parse_hm,
+    "%H%M": __parse_hm_compact
+}
+
+
+@functools.lru_cache(maxsize=512)
+def __cached_str_to_date(date_str, fmt):
+    parser = __date_parsers.get(fmt)
+    if parser is not None:
+        try:
+            return parser(date_str)
+        except ValueError:
+            # Let strptime decide (it also accepts e.g. single digits)
+            pass
+    return datetime.strptime(date_str, fmt).date()
+
+
+@functools.lru_cache(maxsize=2048)
+def __cached_str_to_time(time_str, fmt):
+    parser = __time_parsers.get(fmt)
+    if parser is not None:
+        try:
+            return parser(time_str)
+        except ValueError:
+            pass
+    return datetime.strptime(time_str, fmt).time()
+
+
+@functools.lru_cache(maxsize=2048)
+def __cached_combine(date_value, time_value):
+    return datetime.combine(date_value, time_value)
+
+
+@functools.lru_cache(maxsize=512)
+def __cached_strftime(value, fmt):
+    return value.strftime(fmt)
 
 
 def datetime_to_str(datetime_obj, fmt="%Y-%m-%d %H:%M"):
@@ -27,23 +112,25 @@ def str_to_datetime(date_value, time_value, date_fmt="%Y-%m-%d", time_fmt="%H:%M
     # Allows date and time parameters to be date and time objects respectively,
     # meaning you can use this method to "concatenate" date and time objects.
     if isinstance(date_value, str):
-        date_value = datetime.strptime(date_value, date_fmt).date()
+        date_value = __cached_str_to_date(date_value, date_fmt)
+    elif isinstance(date_value, datetime):
+        date_value = date_value.date()
     if isinstance(time_value, str):
-        time_value = datetime.strptime(time_value, time_fmt).time()
-    return datetime.combine(date_value, time_value)
+        time_value = __cached_str_to_time(time_value, time_fmt)
+    return __cached_combine(date_value, time_value)
 
 
 def date_to_str(date_obj, fmt="%Y-%m-%d"):
-    return date_obj.strftime(fmt)
+    return __cached_strftime(date_obj, fmt)
 
 
 def str_to_date(date_str, fmt="%Y-%m-%d"):
-    return datetime.strptime(date_str, fmt).date()
+    return __cached_str_to_date(date_str, fmt)
 
 
 def time_to_str(time_obj, fmt="%H:%M"):
-    return time_obj.strftime(fmt)
+    return __cached_strftime(time_obj, fmt)
 
 
 def str_to_time(time_str, fmt="%H:%M"):
-    return datetime.strptime(time_str, fmt).time()
\ No newline at end of file
+    return __cached_str_to_time(time_str, fmt)
\ No newline at end of file
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+# Checked by every traced function before doing anything else,
+# so tracing costs a single global lookup while it's turned off.
+ENABLED = False
+
+span_context = contextvars.ContextVar("current_span", default=None)
+__events = []
+__events_lock = threading.Lock()
+__max_events = 0
+__output_path = None
+
+
+class Span:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.parent = None
+        self.start = None
+        self.__token = None
+
+    def __setitem__(self, key, value):
+        self.args[key] = value
+
+    def __enter__(self):
+        self.parent = span_context.get()
+        self.__token = span_context.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        span_context.reset(self.__token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        if self.parent is not None:
+            self.args["parent"] = self.parent.name
+        record_span(self.name, self.start, end, self.args)
+        return False
+
+
+class NullSpan:
+    def __setitem__(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+__null_span = NullSpan()
+
+
+def record_span(name, start_ns, end_ns, args):
+    # Chrome trace "complete" event; timestamps are in microseconds
+    trace_event = {
+        "name": name,
+        "ph": "X",
+        "ts": start_ns / 1000.0,
+        "dur": (end_ns - start_ns) / 1000.0,
+        "pid": os.getpid(),
+        "tid": threading.get_ident()
+    }
+    if args:
+        trace_event["args"] = args
+    with __events_lock:
+        if len(__events) < __max_events:
+            __events.append(trace_event)
+
+
+def current_span():
+    return span_context.get()
+
+
+def span(name, **args):
+    # Usage: with tracing.span("name", key=value): ...
+    if not ENABLED:
+        return __null_span
+    return Span(name, args)
+
+
+def traced(name=None):
+    # Usage: @tracing.traced() or @tracing.traced("custom name")
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def start(output_path, max_events=1000000):
+    # Begins collecting spans, which are written to output_path
+    # (in Chrome trace format, viewable in chrome://tracing or
+    # Perfetto) when stop() is called.
+    global ENABLED, __output_path, __max_events
+    with __events_lock:
+        __events.clear()
+    __output_path = output_path
+    __max_events = max_events
+    ENABLED = True
+
+
+def stop():
+    global ENABLED
+    if not ENABLED:
+        return
+    ENABLED = False
+    with __events_lock:
+        trace_events = list(__events)
+        __events.clear()
+    with open(__output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
\ No newline at end of file
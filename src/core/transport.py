@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Ticketizer.
+# Copyright (c) 2014 Andrew Sun <youlosethegame@live.com>
+#
+# Ticketizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ticketizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import base64
+import collections
+import gzip
+import json
+import threading
+import time
+import urllib.parse
+import requests
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+
+# Archive format version, written in the first line of every archive
+ARCHIVE_VERSION = 1
+
+# Request fields that are never written to an archive
+DEFAULT_REDACTED_FIELDS = frozenset(["userDTO.password"])
+
+# Cookies that carry the login session; their values are archived
+# as placeholders
+DEFAULT_REDACTED_COOKIES = frozenset(["JSESSIONID", "BIGipServerotn", "tk", "uamtk"])
+
+# Request fields and response JSON keys holding personal details
+# (account and passenger names, ID and phone numbers), which are
+# archived as placeholders
+DEFAULT_REDACTED_KEYS = frozenset([
+    "loginUserDTO.user_name", "passenger_name", "passenger_id_no",
+    "mobile_no", "phone_no", "email", "address"
+])
+
+# Passenger strings sent with orders, and the comma separated
+# positions of the personal details in each passenger's entry
+# (see core.auth.purchase.PassengerTemplate)
+PASSENGER_STR_FIELDS = {
+    "oldPassengerStr": (0, 2),
+    "passengerTicketStr": (3, 5, 6)
+}
+
+
+class ReplayMissError(requests.RequestException):
+    # Raised when a replayed request has no recorded response
+    pass
+
+
+def encode_form(data):
+    # Normalizes request data (dict, list of pairs, str or bytes) to a
+    # form-encoded string, so recorded and replayed requests compare equal
+    if data is None:
+        return ""
+    if isinstance(data, bytes):
+        return data.decode("utf-8", "replace")
+    if isinstance(data, str):
+        return data
+    if isinstance(data, dict):
+        data = data.items()
+    return urllib.parse.urlencode(list(data))
+
+
+class Redactor:
+    # Strips secrets and personal details from recorded exchanges, so
+    # that archives can be shared as fixtures. Instead of being blanked,
+    # session cookies and personal details are replaced by placeholders
+    # (redacted1, redacted2, ...), the same value always getting the
+    # same placeholder. A redacted passenger list therefore still
+    # matches the redacted orders made for it when replayed.
+    def __init__(self, fields=DEFAULT_REDACTED_FIELDS, cookies=DEFAULT_REDACTED_COOKIES,
+                 keys=DEFAULT_REDACTED_KEYS):
+        self.fields = fields
+        self.cookies = cookies
+        self.keys = keys
+        self.__lock = threading.Lock()
+        self.__placeholders = {}
+
+    def placeholder(self, value):
+        if value is None or value == "":
+            return value
+        with self.__lock:
+            placeholder = self.__placeholders.get(value)
+            if placeholder is None:
+                placeholder = "redacted{0}".format(len(self.__placeholders) + 1)
+                self.__placeholders[value] = placeholder
+            return placeholder
+
+    def __redact_passenger_str(self, value, positions):
+        entries = []
+        for entry in value.split("_"):
+            parts = entry.split(",")
+            for i in positions:
+                if i < len(parts):
+                    parts[i] = self.placeholder(parts[i])
+            entries.append(",".join(parts))
+        return "_".join(entries)
+
+    def __redact_field(self, key, value):
+        if key in self.fields:
+            return ""
+        if key in self.keys:
+            return self.placeholder(value)
+        positions = PASSENGER_STR_FIELDS.get(key)
+        if positions is not None:
+            return self.__redact_passenger_str(value, positions)
+        return value
+
+    def redact_form(self, form):
+        if len(form) == 0:
+            return form
+        pairs = urllib.parse.parse_qsl(form, keep_blank_values=True)
+        return urllib.parse.urlencode([(key, self.__redact_field(key, value)) for key, value in pairs])
+
+    def redact_cookie(self, name, value):
+        return self.placeholder(value) if name in self.cookies else value
+
+    def redact_set_cookie(self, header, cookies):
+        # Replaces the values of the given (name, value) response
+        # cookies in a (possibly combined) Set-Cookie header
+        for name, value in cookies:
+            if name in self.cookies and value:
+                header = header.replace(
+                    "{0}={1}".format(name, value), "{0}={1}".format(name, self.placeholder(value)))
+        return header
+
+    def __redact_json(self, data):
+        if isinstance(data, dict):
+            return {key: self.placeholder(value) if key in self.keys and isinstance(value, str)
+                    else self.__redact_json(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self.__redact_json(value) for value in data]
+        return data
+
+    def redact_content(self, content):
+        # Only JSON responses that mention one of the keys are
+        # rewritten; everything else is archived byte for byte
+        if len(self.keys) == 0:
+            return content
+        try:
+            text = content.decode("utf-8")
+        except UnicodeDecodeError:
+            return content
+        if not any('"{0}"'.format(key) in text for key in self.keys):
+            return content
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return content
+        return json.dumps(self.__redact_json(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_body(body):
+    # Bodies are stored as text when possible, which keeps the
+    # (gzipped) archive small and readable
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(body).decode("ascii")}
+
+
+def decode_body(entry):
+    if "text" in entry:
+        return entry["text"].encode("utf-8")
+    return base64.b64decode(entry["base64"])
+
+
+class RecordedExchange:
+    # One request/response pair from an archive
+    def __init__(self, data):
+        self.method = data["method"]
+        self.endpoint = data["endpoint"]
+        self.url = data["url"]
+        self.query = data["query"]
+        self.body = data["body"]
+        self.request_headers = data["request_headers"]
+        self.request_cookies = data["request_cookies"]
+        self.status = data["status"]
+        self.reason = data["reason"]
+        self.headers = data["headers"]
+        self.cookies = data["cookies"]
+        self.content = decode_body(data["content"])
+        # Seconds from sending the request to the last byte of the body
+        self.elapsed = data["elapsed"]
+        # Seconds since the start of the recording
+        self.offset = data["offset"]
+
+    def create_response(self):
+        response = requests.Response()
+        response.status_code = self.status
+        response.reason = self.reason
+        response.url = self.url
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = self.content
+        response._content_consumed = True
+        jar = RequestsCookieJar()
+        for name, value, domain, path in self.cookies:
+            jar.set(name, value, domain=domain, path=path)
+        response.cookies = jar
+        return response
+
+
+def read_archive(path):
+    # Returns the list of RecordedExchanges in an archive
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != ARCHIVE_VERSION:
+            raise ValueError("Unsupported archive version: {0}".format(header.get("version")))
+        return [RecordedExchange(json.loads(line)) for line in f if line.strip()]
+
+
+class RequestRecorder:
+    # Sends requests as normal and appends every request/response pair
+    # to a gzipped JSON lines archive. Use as core.webrequest.transport.
+    def __init__(self, path, redactor=None):
+        self.path = path
+        self.redactor = redactor or Redactor()
+        self.count = 0
+        self.__lock = threading.Lock()
+        self.__start_time = time.perf_counter()
+        self.__file = gzip.open(path, "wt", encoding="utf-8")
+        self.__write({"version": ARCHIVE_VERSION, "created": time.time()})
+
+    def __write(self, data):
+        self.__file.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        self.__file.write("\n")
+
+    def send(self, session, method, url, endpoint, kwargs):
+        start_time = time.perf_counter()
+        response = session.request(method, url, verify=False, stream=True, **kwargs)
+        # The whole body is needed for the archive; this is the same
+        # as what a non-streamed request would have done anyway
+        content = response.content
+        elapsed = time.perf_counter() - start_time
+        redactor = self.redactor
+        request_cookies = kwargs.get("cookies")
+        request_cookies = request_cookies.items() if request_cookies is not None else ()
+        response_cookies = [(c.name, c.value) for c in response.cookies]
+        headers = dict(response.headers)
+        if "Set-Cookie" in headers:
+            headers["Set-Cookie"] = redactor.redact_set_cookie(headers["Set-Cookie"], response_cookies)
+        data = {
+            "method": method.upper(),
+            "endpoint": endpoint,
+            "url": url,
+            "query": redactor.redact_form(urllib.parse.urlsplit(url).query),
+            "body": redactor.redact_form(encode_form(kwargs.get("data"))),
+            "request_headers": dict(kwargs.get("headers") or {}),
+            "request_cookies": {name: redactor.redact_cookie(name, value) for name, value in request_cookies},
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": headers,
+            "cookies": [(c.name, redactor.redact_cookie(c.name, c.value), c.domain, c.path)
+                        for c in response.cookies],
+            "content": encode_body(redactor.redact_content(content)),
+            "elapsed": elapsed,
+            "offset": start_time - self.__start_time
+        }
+        with self.__lock:
+            self.__write(data)
+            self.count += 1
+        return response
+
+    def close(self):
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.close()
+
+
+class RequestReplayer:
+    # Answers requests from an archive instead of the network. Use as
+    # core.webrequest.transport.
+    #
+    # Requests are matched by method and endpoint, preferring a
+    # recording with the same query string and body; otherwise the
+    # recordings for that endpoint are handed out in the order they
+    # were made. Given the same sequence of requests, the responses
+    # are always the same.
+    def __init__(self, exchanges):
+        # Multiplier for the recorded latency of each response; 0 (the
+        # default) answers immediately, 1 replays the original timing
+        self.latency_scale = 0.0
+        # Start again from the first recording once an endpoint's
+        # recordings run out, instead of raising ReplayMissError
+        self.repeat = True
+        self.__lock = threading.Lock()
+        self.__exchanges = collections.OrderedDict()
+        for exchange in exchanges:
+            self.__exchanges.setdefault((exchange.method, exchange.endpoint), []).append(exchange)
+        self.__positions = {key: 0 for key in self.__exchanges}
+        self.__used = set()
+
+    @classmethod
+    def load(cls, path):
+        return cls(read_archive(path))
+
+    def reset(self):
+        with self.__lock:
+            for key in self.__positions:
+                self.__positions[key] = 0
+            self.__used.clear()
+
+    def __find_exact(self, candidates, query, body):
+        for exchange in candidates:
+            if id(exchange) not in self.__used and exchange.query == query and exchange.body == body:
+                return exchange
+        return None
+
+    def __next_unused(self, key, candidates):
+        position = self.__positions[key]
+        while position < len(candidates) and id(candidates[position]) in self.__used:
+            position += 1
+        self.__positions[key] = position
+        if position < len(candidates):
+            return candidates[position]
+        return None
+
+    def __take(self, key, query, body):
+        candidates = self.__exchanges.get(key)
+        if candidates is None:
+            return None
+        exchange = self.__find_exact(candidates, query, body) or self.__next_unused(key, candidates)
+        if exchange is None and self.repeat:
+            for candidate in candidates:
+                self.__used.discard(id(candidate))
+            self.__positions[key] = 0
+            exchange = self.__find_exact(candidates, query, body) or self.__next_unused(key, candidates)
+        if exchange is not None:
+            self.__used.add(id(exchange))
+        return exchange
+
+    def send(self, session, method, url, endpoint, kwargs):
+        key = (method.upper(), endpoint)
+        query = urllib.parse.urlsplit(url).query
+        body = encode_form(kwargs.get("data"))
+        with self.__lock:
+            exchange = self.__take(key, query, body)
+        if exchange is None:
+            raise ReplayMissError("No recorded response for {0} {1}".format(*key))
+        if self.latency_scale > 0:
+            time.sleep(exchange.elapsed * self.latency_scale)
+        return exchange.create_response()
\ No newline at end of file
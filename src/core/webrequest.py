@@ -15,44 +15,257 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
+import http.cookiejar
+import threading
+import time
 import requests
 import urllib.parse
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
-from core import logger, jsonwrapper
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from core import logger, jsonwrapper, metrics
 from core.auth.cookies import SessionCookies
+from core.logger import LogType
+from core.metrics import MetricsRegistry
 
+PHASE_HELP = "Request latency by phase (connect includes DNS and TLS)"
 
-def request(method, url, **kwargs):
-    def generate_log():
-        log_values = ["[{0}] {1}".format(method.upper(), url)]
-        for arg, value in kwargs.items():
-            if value is None:
+# Set to a core.auth.affinity.AffinityPolicy to track the backend
+# server behind each response and steer away from slow ones.
+affinity_policy = None
+
+# Set to a core.transport.RequestRecorder to save every request and
+# response to an archive, or a RequestReplayer to answer requests
+# from one instead of the network.
+transport = None
+
+# The root of the 12306 API, which every URL in core is written against
+DEFAULT_BASE_URL = "https://kyfw.12306.cn/otn/"
+
+__endpoints = {}
+__base_url = DEFAULT_BASE_URL
+__endpoint_urls = {}
+__resolved_urls = {}
+
+# Per-thread accumulator for time spent opening connections
+# (DNS lookup + TCP connect + TLS handshake) during a request.
+__connect_timer = threading.local()
+
+
+def add_connect_time(elapsed):
+    __connect_timer.elapsed = getattr(__connect_timer, "elapsed", 0.0) + elapsed
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start_time = time.perf_counter()
+        try:
+            super(TimedHTTPConnection, self).connect()
+        finally:
+            add_connect_time(time.perf_counter() - start_time)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start_time = time.perf_counter()
+        try:
+            super(TimedHTTPSConnection, self).connect()
+        finally:
+            add_connect_time(time.perf_counter() - start_time)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool
+        }
+
+
+def create_session():
+    # A single shared session lets requests reuse pooled keep-alive
+    # connections instead of opening a new one for every call.
+    session = requests.Session()
+    # Cookies are always passed in explicitly per request (usually as a
+    # SessionCookies jar), so the shared session must never remember them.
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    adapter = TimedHTTPAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+__session = create_session()
+
+
+def generate_log(method, url, kwargs):
+    log_values = ["[{0}] {1}".format(method.upper(), url)]
+    for arg, value in kwargs.items():
+        if value is None:
+            continue
+        try:
+            if len(value) == 0:
                 continue
-            try:
-                if len(value) == 0:
-                    continue
-                if isinstance(value, (dict, SessionCookies)):
-                    value = value.items()
-                value = "".join(map(lambda x: "\n   -> {0}: {1}".format(*x), value))
-            except TypeError:
-                pass
-            log_values.append(" -> {0}: {1}".format(arg, value))
-        return "\n".join(log_values)
-
-    logger.network(generate_log)
+            if isinstance(value, (dict, SessionCookies)):
+                value = value.items()
+            value = "".join(map(lambda x: "\n   -> {0}: {1}".format(*x), value))
+        except TypeError:
+            pass
+        log_values.append(" -> {0}: {1}".format(arg, value))
+    return "\n".join(log_values)
+
+
+def get_endpoint(url):
+    # Maps a full URL to the short name of the API endpoint,
+    # e.g. https://kyfw.12306.cn/otn/leftTicket/query -> leftTicket/query
+    endpoint = __endpoints.get(url)
+    if endpoint is None:
+        path = urllib.parse.urlsplit(url).path
+        if path.startswith("/otn/"):
+            path = path[5:]
+        endpoint = __endpoints[url] = path
+    return endpoint
+
+
+def set_base_url(base_url):
+    # Sends every request for the 12306 API (which core addresses
+    # by its full URL) to base_url instead, e.g. a local stand-in
+    # server at http://127.0.0.1:8306/otn/
+    global __base_url
+    if not base_url.endswith("/"):
+        base_url += "/"
+    __base_url = base_url
+    __resolved_urls.clear()
+
+
+def set_endpoint_url(endpoint, url):
+    # Overrides the URL of a single endpoint (by its short name, e.g.
+    # leftTicket/query). Pass None to remove the override.
+    if url is None:
+        __endpoint_urls.pop(endpoint, None)
+    else:
+        __endpoint_urls[endpoint] = url
+    __resolved_urls.clear()
+
+
+def resolve_url(url):
+    # Maps a 12306 URL to the one the request should actually go to
+    resolved = __resolved_urls.get(url)
+    if resolved is None:
+        resolved = __endpoint_urls.get(get_endpoint(url))
+        if resolved is None:
+            if url.startswith(DEFAULT_BASE_URL):
+                resolved = __base_url + url[len(DEFAULT_BASE_URL):]
+            else:
+                resolved = url
+        __resolved_urls[url] = resolved
+    return resolved
+
+
+def log_request_event(method, url, response, duration, stream):
+    logger.event(
+        LogType.NETWORK, "request",
+        endpoint=get_endpoint(url),
+        duration=duration * 1000,
+        status=response.status_code,
+        # Don't force a streamed body to be downloaded just for logging
+        bytes=None if stream else len(response.content),
+        method=method.upper()
+    )
+
+
+def record_request_metrics(url, response, connect_time, header_time, download_time):
+    registry = MetricsRegistry.instance()
+    endpoint = get_endpoint(url)
+    registry.histogram("request_phase_seconds", PHASE_HELP, endpoint=endpoint, phase="connect").observe(connect_time)
+    registry.histogram("request_phase_seconds", PHASE_HELP, endpoint=endpoint, phase="ttfb").observe(header_time)
+    if download_time is not None:
+        registry.histogram("request_phase_seconds", PHASE_HELP, endpoint=endpoint, phase="download").observe(download_time)
+        registry.counter("response_bytes_total", "Response body bytes received",
+                         endpoint=endpoint).inc(len(response.content))
+    total_time = connect_time + header_time + (download_time or 0.0)
+    registry.histogram("request_duration_seconds", "Total request latency", endpoint=endpoint).observe(total_time)
+    registry.counter("requests_total", "Completed requests",
+                     endpoint=endpoint, status=response.status_code).inc()
+
+
+def record_decode_metrics(url, decode_time):
+    MetricsRegistry.instance().histogram(
+        "request_phase_seconds", PHASE_HELP, endpoint=get_endpoint(url), phase="decode").observe(decode_time)
+
+
+def request(method, url, **kwargs):
+    if logger.NETWORK_ENABLED:
+        logger.network(generate_log, method, url, kwargs)
+    endpoint_url = url
+    url = resolve_url(url)
     params = kwargs.get("params")
     if isinstance(params, list):
         url += "?" + urllib.parse.urlencode(params)
         kwargs["params"] = None
-    response = requests.request(method, url, verify=False, **kwargs)
+
+    # The body is read separately (unless the caller asked for a
+    # streamed response) so that header and download time can be
+    # told apart. The result is the same as a non-streamed request.
+    stream = kwargs.pop("stream", False)
+    cookies = kwargs.get("cookies")
+    affinity = affinity_policy if isinstance(cookies, SessionCookies) else None
+    timed = metrics.ENABLED or logger.STRUCTURED_ENABLED or affinity is not None
+    if timed:
+        __connect_timer.elapsed = 0.0
+        start_time = time.perf_counter()
+    try:
+        if transport is None:
+            response = __session.request(method, url, verify=False, stream=True, **kwargs)
+        else:
+            response = transport.send(__session, method, url, get_endpoint(endpoint_url), kwargs)
+    except requests.RequestException:
+        if metrics.ENABLED:
+            MetricsRegistry.instance().counter(
+                "request_errors_total", "Requests that failed without a response",
+                endpoint=get_endpoint(endpoint_url)).inc()
+        if affinity is not None:
+            affinity.record(cookies, time.perf_counter() - start_time, True)
+        raise
+    if not stream:
+        if timed:
+            header_time = time.perf_counter()
+        response.content
+    if timed:
+        end_time = time.perf_counter()
+        connect_time = __connect_timer.elapsed
+        if stream:
+            header_time = end_time
+        if metrics.ENABLED:
+            record_request_metrics(
+                endpoint_url, response,
+                connect_time,
+                header_time - start_time - connect_time,
+                None if stream else end_time - header_time)
+        if logger.STRUCTURED_ENABLED:
+            log_request_event(method, endpoint_url, response, end_time - start_time, stream)
+
     try:
         response.raise_for_status()
     except HTTPError as ex:
-        logger.network("HTTPError occured: {0}", ex.args[0])
+        if logger.NETWORK_ENABLED:
+            logger.network("HTTPError occured: {0}", ex.args[0])
+        if affinity is not None:
+            affinity.record(cookies, end_time - start_time, True)
         raise
-    cookies = kwargs.get("cookies")
     if isinstance(cookies, SessionCookies):
         cookies.update(response.cookies)
+        if affinity is not None:
+            affinity.record(cookies, end_time - start_time, False)
     return response
 
 
@@ -64,9 +277,19 @@ def post(url, **kwargs):
     return request("post", url, **kwargs)
 
 
+def read_json(url, response):
+    if not metrics.ENABLED:
+        return jsonwrapper.read(response)
+    start_time = time.perf_counter()
+    try:
+        return jsonwrapper.read(response)
+    finally:
+        record_decode_metrics(url, time.perf_counter() - start_time)
+
+
 def get_json(url, **kwargs):
-    return jsonwrapper.read(get(url, **kwargs))
+    return read_json(url, get(url, **kwargs))
 
 
 def post_json(url, **kwargs):
-    return jsonwrapper.read(post(url, **kwargs))
\ No newline at end of file
+    return read_json(url, post(url, **kwargs))
\ No newline at end of file
@@ -21,6 +21,9 @@ hide_not_yet_sold = False
 # Normal helpful config
 train_type_filter = ["T", "D", "?"]
 ticket_type_filter = ["一等座", "二等座"]
+# Seat types to try first, in order, for every passenger at once
+# (overrides the seat lists in passengers)
+# seat_preferences = ["二等座", "一等座"]
 train_range_filters = {
     "departure_time": (None, None),
     "arrival_time": (None, None),
@@ -45,11 +48,32 @@ custom_passengers = {
 
 # Other config
 save_session = True
+session_path = "session.json"
+heartbeat_interval = 60
+backend_affinity = False
+# Where to send 12306 API requests, e.g. a local stand-in server
+# started with python -m benchmarks.standin
+base_url = None
 confirm_purchase = True
 exact_departure_station = False
 exact_destination_station = False
 open_purchase_page = True
+# Seconds between order queue polls, unless the server estimates a
+# wait time; the delay then backs off up to queue_max_delay
 queue_refresh_rate = 1
+queue_max_delay = 5
+queue_timeout = None
+# Write log lines from a background thread. Off by default, since
+# those lines can then show up after the prompts that follow them.
+async_logging = False
+log_format = "text"
+log_path = None
+metrics_path = None
+# Save every request and response to an archive, or answer requests
+# from a saved archive instead of the network (set only one). Saved
+# archives hold no password, session cookies or passenger details.
+record_path = None
+replay_path = None
 
 # Programming knowledge required
 # captcha_solver = None  # class
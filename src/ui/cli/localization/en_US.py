@@ -43,6 +43,8 @@ NO_TRAINS_FOUND = "No trains were found between these two stations!"
 RETRYING_SEARCH = "Searching again in {0} secs."
 ORDER_COMPLETED = "Order completed! Order ID: {0}"
 ORDER_INTERRUPTED = "Order interrupted! Please check your order ID manually!"
+SESSION_LOST = "The login session expired and logging in again failed!"
+ORDER_PENDING = "Order still pending after {0} secs! Please check your order status manually!"
 ENTER_TRANSFER_TIME = "Enter the {0} transfer time (format: HH:MM): "
 MINIMUM = "minimum"
 MAXIMUM = "maximum"
@@ -17,30 +17,41 @@
 # along with Ticketizer.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import time
+import atexit
 import codecs
 import argparse
 import importlib
 import webbrowser
 import datetime
+import requests
 # import getpass
 
 # Oh dear god, it's dependency hell >_<
-from core import timeconverter, logger
+from core import timeconverter, logger, metrics, tracing, webrequest
 from core.auth.cookies import SessionCookies
-from core.logger import LogType
+from core.logger import LogType, OutputFormat
+from core.logwriter import AsyncLogWriter, MultiSink, RotatingFileSink
+from core.metrics import MetricsRegistry
 from core.enums import TrainType, TicketType, TicketStatus, PassengerType, IdentificationType, Gender
 from core.processing.containers import ValueRange
 from core.processing.filter import TrainFilter
 from core.processing.sort import TrainSorter
+from core.processing.candidates import CandidateQueue
 from core.data.station import StationList
 from core.data.passenger import Passenger
-from core.search.search import TrainQuery, DateOutOfRangeError
+from core.search.search import TrainQuery, TrainSearch, DateOutOfRangeError
 from core.auth.login import LoginManager
+from core.auth.session import SessionManager
+from core.auth.affinity import AffinityPolicy
+from core.transport import RequestRecorder, RequestReplayer
+from core.jsonwrapper import RequestError
 from core.auth.login import InvalidUsernameError, InvalidPasswordError
 from core.auth.login import TooManyLoginAttemptsError, SystemMaintenanceError
 from core.auth.purchase import TicketPurchaser
 from core.auth.purchase import DataExpiredError, UnfinishedTransactionError
-from core.auth.purchase import NotEnoughTicketsError, StopPurchaseQueue
+from core.auth.purchase import NotEnoughTicketsError, NotLoggedInError
+from core.auth.orderqueue import QueueTimeoutError
+from core.extra.pricing import PriceQuery
 # Wow! We're still alive!
 
 
@@ -100,6 +111,7 @@ def select_destination_station(station_list, auto):
     )
 
 
+@tracing.traced()
 def select_train(train_list, auto):
     def train_info_repr(train):
         day_delta = train.arrival_time.day - train.departure_time.day
@@ -167,8 +179,12 @@ def select_passengers(passenger_list, auto):
     )
 
 
-def select_tickets(passenger_list, ticket_list, auto):
-    # TODO: Add automation
+def select_tickets(passenger_list, ticket_list, auto, ticket_type=None):
+    if auto and ticket_type is not None:
+        # The seat type was already picked from the candidate queue
+        for ticket in ticket_list:
+            if ticket.type == ticket_type:
+                return {passenger: ticket for passenger in passenger_list}
 
     print_list(ticket_list, lambda t: "{0}\t({1}元, {2} remaining)".format(
         TicketType.FULL_NAME_LOOKUP[t.type].ljust(4), t.price, t.count
@@ -293,6 +309,41 @@ def create_train_sorters():
     return sorter_obj
 
 
+def get_seat_preferences():
+    # Seat type names to try, best first, or None for the defaults.
+    # Every passenger gets the same seat type, so these come from the
+    # passengers' seat lists: the types they all accept, in the order
+    # the first passenger listed them. seat_preferences overrides that.
+    seat_preferences = config.get("seat_preferences")
+    if seat_preferences is not None:
+        return seat_preferences
+    cfg_passengers = config.get("passengers")
+    if not isinstance(cfg_passengers, dict):
+        return None
+    seat_lists = [seat_list for seat_list in cfg_passengers.values() if seat_list]
+    if len(seat_lists) == 0:
+        return None
+    common_seats = [name for name in seat_lists[0] if all(name in seat_list for seat_list in seat_lists[1:])]
+    if len(common_seats) == 0:
+        logger.warning("Passengers have no seat type in common, using the first passenger's seat list")
+        return seat_lists[0]
+    return common_seats
+
+
+def create_candidate_queue(search):
+    seat_preferences = get_seat_preferences()
+    if seat_preferences is not None:
+        seat_preferences = [TicketType.REVERSE_FULL_NAME_LOOKUP[name] for name in seat_preferences]
+    ticket_filter = search.filter.ticket_filter if search.filter is not None else None
+    queue = CandidateQueue(seat_preferences, ticket_filter)
+
+    # Every selected passenger needs a seat on the same train
+    cfg_passengers = config.get("passengers")
+    if cfg_passengers is not None:
+        queue.min_count = max(1, sum(1 if isinstance(key, str) else len(key) for key in cfg_passengers))
+    return queue
+
+
 def get_passenger_list(purchaser):
     passenger_list = purchaser.get_passenger_list()
     custom_passengers = config.get("custom_passengers")
@@ -317,12 +368,7 @@ def get_passenger_list(purchaser):
 
 
 def purchase_queue_callback(queue_length):
-    sleep_time = config.get("queue_refresh_rate", 1)
-    try:
-        print(localization.QUEUE_WAIT.format(queue_length))
-        time.sleep(sleep_time)
-    except KeyboardInterrupt:
-        raise StopPurchaseQueue()
+    print(localization.QUEUE_WAIT.format(queue_length))
 
 
 # -----------------------------Generic utilities------------------------------
@@ -550,9 +596,9 @@ def setup_localization():
 def setup_log_verbosity(verbosity_str):
     verbosity_str = verbosity_str.upper()
     if verbosity_str == "ALL":
-        logger.enabled_log_types = LogType.ALL
+        logger.set_enabled_log_types(LogType.ALL)
     elif verbosity_str == "NONE":
-        logger.enabled_log_types = LogType.NONE
+        logger.set_enabled_log_types(LogType.NONE)
     else:
         verbosity = 0
         for verbosity_flag in verbosity_str:
@@ -561,7 +607,71 @@ def setup_log_verbosity(verbosity_str):
             except KeyError:
                 print("Invalid log verbosity value: " + verbosity_flag)
                 return False
-        logger.enabled_log_types = verbosity
+        logger.set_enabled_log_types(verbosity)
+    return True
+
+
+def setup_log_output():
+    log_format = config.get("log_format", "text")
+    if log_format == "json":
+        logger.set_output_format(OutputFormat.JSON)
+    elif log_format != "text":
+        print("Invalid log format: " + log_format)
+        return False
+
+    # Don't mix terminal color codes into machine-readable output
+    sinks = [logger.ConsoleSink(use_color=None if log_format == "text" else False)]
+    log_path = config.get("log_path")
+    if log_path is not None:
+        try:
+            sinks.append(RotatingFileSink(
+                log_path,
+                max_bytes=config.get("log_max_bytes", 10 * 1024 * 1024),
+                backup_count=config.get("log_backup_count", 3)
+            ))
+        except OSError as ex:
+            print("Log file could not be opened! " + repr(ex))
+            return False
+    if config.get("async_logging", False):
+        logger.set_sink(AsyncLogWriter(sinks, max_queue=config.get("log_queue_size", 10000)))
+    elif len(sinks) > 1:
+        logger.set_sink(MultiSink(sinks))
+    return True
+
+
+def setup_metrics():
+    metrics_path = config.get("metrics_path")
+    if metrics_path is not None:
+        metrics.set_enabled(True)
+        atexit.register(lambda: MetricsRegistry.instance().dump_prometheus(metrics_path))
+    return True
+
+
+def setup_endpoints():
+    # Lets the whole client run against e.g. a local stand-in server
+    base_url = config.get("base_url")
+    if base_url is not None:
+        webrequest.set_base_url(base_url)
+    for endpoint, url in config.get("endpoint_urls", {}).items():
+        webrequest.set_endpoint_url(endpoint, url)
+    return True
+
+
+def setup_transport():
+    record_path = config.get("record_path")
+    replay_path = config.get("replay_path")
+    if record_path is not None:
+        recorder = RequestRecorder(record_path)
+        webrequest.transport = recorder
+        atexit.register(recorder.close)
+    elif replay_path is not None:
+        webrequest.transport = RequestReplayer.load(replay_path)
+    return True
+
+
+def setup_backend_affinity():
+    if config.get("backend_affinity", False):
+        webrequest.affinity_policy = AffinityPolicy()
     return True
 
 
@@ -570,11 +680,21 @@ def setup():
     parser.add_argument("--verbosity")
     parser.add_argument("--config")
     parser.add_argument("--auto", action="store_true", default=False)
+    parser.add_argument("--trace")
     args = vars(parser.parse_args())
 
+    if args["trace"] is not None:
+        tracing.start(args["trace"])
+        atexit.register(tracing.stop)
+
     return args["auto"], \
         setup_log_verbosity(args["verbosity"] or "we") and \
         load_config(args["config"] or "config.py") and \
+        setup_log_output() and \
+        setup_metrics() and \
+        setup_endpoints() and \
+        setup_transport() and \
+        setup_backend_affinity() and \
         setup_localization()
 
 
@@ -649,7 +769,18 @@ def login(cookies, retry, auto):
             return None
 
 
-def query(station_list, retry, auto):
+def search_uses_prices(search):
+    # Whether filtering or sorting the results reads ticket prices
+    train_sorters = config.get("train_sorters") or ()
+    if any(name.lstrip("!") == "price" for name in train_sorters):
+        return True
+    if search.filter is None:
+        return False
+    price_range = search.filter.ticket_filter.price_range
+    return price_range.lower is not None or price_range.upper is not None
+
+
+def create_train_search(station_list, auto, cookies=None):
     # Construct query object
     query_obj = TrainQuery()
     query_obj.date = select_train_date(auto)
@@ -658,10 +789,25 @@ def query(station_list, retry, auto):
     query_obj.exact_departure_station = config.get("exact_departure_station", False)
     query_obj.exact_destination_station = config.get("exact_destination_station", False)
 
-    filter_obj = create_train_filters()
-    sorter_obj = create_train_sorters()
-    custom_filter = config.get("custom_filter")
-    custom_sorter = config.get("custom_sorter")
+    search = TrainSearch(query_obj, create_train_filters(), create_train_sorters())
+    search.custom_filter = config.get("custom_filter")
+    search.custom_sorter = config.get("custom_sorter")
+
+    # Price the whole result list with one request (and one captcha)
+    # rather than one request per train, if anything needs the prices
+    if cookies is not None and search_uses_prices(search):
+        search.price_query = PriceQuery(cookies)
+        search.captcha_solver = solve_captcha
+    return search
+
+
+@tracing.traced()
+def query(station_list, retry, auto, search=None):
+    # Build the search once; callers that search repeatedly
+    # should pass it back in so that it is reused.
+    if search is None:
+        search = create_train_search(station_list, auto)
+    query_obj = search.query
     sleep_time = config.get("search_retry_rate", 1)
 
     while True:
@@ -676,11 +822,9 @@ def query(station_list, retry, auto):
             query_obj.date = select_train_date(False)
             continue
 
-        # Now we filter the resulting list
+        # Now we filter and sort the resulting list
         original_count = len(train_list)
-        train_list = filter_obj.filter(train_list)
-        if custom_filter is not None:
-            custom_filter(train_list)
+        train_list = search.apply(train_list)
         filtered_count = len(train_list)
 
         # Make sure there's at least one train
@@ -697,18 +841,23 @@ def query(station_list, retry, auto):
                 print(localization.NO_TRAINS_FOUND)
                 return None
 
-        # After filtering the trains, we sort the list
-        sorter_obj.sort(train_list)
-        if custom_sorter is not None:
-            custom_sorter(train_list)
-
         return train_list
 
 
-def purchase(cookies, train, auto):
+def create_purchaser(cookies):
     purchaser = TicketPurchaser(cookies)
-    purchaser.train = train
     purchaser.queue_callback = purchase_queue_callback
+    # The purchaser paces itself using the server's wait time estimate,
+    # backing off from the refresh rate up to the maximum delay.
+    purchaser.queue_min_delay = config.get("queue_refresh_rate", 1)
+    purchaser.queue_max_delay = config.get("queue_max_delay", purchaser.queue_max_delay)
+    purchaser.queue_deadline = config.get("queue_timeout")
+    return purchaser
+
+
+@tracing.traced()
+def purchase(purchaser, train, auto, ticket_type=None):
+    purchaser.train = train
     purchase_data = purchaser.begin_purchase()
 
     # Get passengers
@@ -717,14 +866,28 @@ def purchase(cookies, train, auto):
 
     # Select tickets
     available_tickets = [t for t in train.tickets if t.status == TicketStatus.NORMAL]
-    selected_tickets = select_tickets(selected_passenger_list, available_tickets, auto)
+    selected_tickets = select_tickets(selected_passenger_list, available_tickets, auto, ticket_type)
     purchase_data.ticket_map = selected_tickets
 
     # Solve captcha
     solve_captcha(purchaser.captcha)
 
     # Submit the order
-    order_id = purchaser.complete_purchase(purchase_data)
+    try:
+        order_id = purchaser.complete_purchase(purchase_data)
+    except KeyboardInterrupt:
+        # Stop waiting; the order might still go through though
+        purchaser.cancel_token.cancel()
+        order_id = None
+    except QueueTimeoutError:
+        # Same as above, but the order is still in the queue, so
+        # don't go on to buy anything else either
+        purchaser.cancel_token.cancel()
+        print(localization.ORDER_PENDING.format(purchaser.queue_deadline))
+        return None
+    finally:
+        logger.debug(lambda: "Purchase step timings: " + ", ".join(
+            "{0}={1:.3f}s".format(step, duration) for step, duration in purchaser.step_timings.items()))
     if order_id is not None:
         print(localization.ORDER_COMPLETED.format(order_id))
     else:
@@ -732,7 +895,69 @@ def purchase(cookies, train, auto):
     return order_id
 
 
+def resume_session(cookies):
+    # Tries to continue the session saved by a previous run, which
+    # only costs a single request instead of a captcha and login.
+    if not config.get("save_session", False):
+        return None
+    if not cookies.attach_store(config.get("session_path", "session.json")):
+        return None
+    login_manager = LoginManager(cookies)
+    try:
+        if login_manager.is_logged_in():
+            logger.debug("Resumed saved session")
+            return login_manager
+    except (RequestError, requests.RequestException) as ex:
+        logger.debug("Could not check saved session: {0!r}", ex)
+    # Don't carry the stale cookies into the new login
+    cookies.reset()
+    return None
+
+
+@tracing.traced("select_train")
+def select_candidate(queue):
+    # The auto-buy counterpart of select_train: the queue is already
+    # ranked, so this just takes the best candidate that's left
+    candidate = queue.pop()
+    if candidate is not None:
+        logger.debug("Selected {0}", candidate)
+    return candidate
+
+
+def purchase_candidates(search, purchaser, queue, session_manager):
+    # Tries to buy tickets for each (train, seat type) candidate in
+    # order of preference, moving straight on to the next one when a
+    # purchase fails instead of searching again. Returns None once
+    # every candidate has failed.
+    refreshed = set()
+    while True:
+        candidate = select_candidate(queue)
+        if candidate is None:
+            return None
+        if not session_manager.ensure_fresh():
+            raise NotLoggedInError()
+        try:
+            return purchase(purchaser, candidate.train, auto=True, ticket_type=candidate.ticket_type)
+        except DataExpiredError:
+            # This means the train's secret key expired between
+            # querying train data and submitting the order. Only
+            # that train needs to be re-queried; if it's gone (or
+            # expires again), fall through to the next candidate.
+            train_id = candidate.train.id
+            new_train = None if train_id in refreshed else search.refresh_train(candidate.train)
+            if new_train is not None and queue.replace_train(new_train):
+                refreshed.add(train_id)
+                queue.push(candidate)
+            else:
+                queue.mark_failed(candidate)
+        except NotEnoughTicketsError:
+            # Tickets ran out while we tried to purchase
+            logger.debug("Not enough tickets for {0}", candidate)
+            queue.mark_failed(candidate)
+
+
 # ----------------------------------Main UI-----------------------------------
+@tracing.traced()
 def autobuy():
     # Get station list
     station_list = StationList.instance()
@@ -741,40 +966,57 @@ def autobuy():
     # Login beforehand (just in case!)
     # TODO: Allow multiple logins
     try:
-        login_manager = login(cookies, retry=True, auto=True)
+        login_manager = resume_session(cookies) or login(cookies, retry=True, auto=True)
     except SystemMaintenanceError:
         # Stupid website goes offline every night for "maintenance".
         print(localization.SYSTEM_OFFLINE)
         return None
 
-    retry_search = config.get("search_retry", True)
-    while True:
-        # Search for train
-        train_list = query(station_list, retry=retry_search, auto=True)
-        if train_list is None:
-            # No trains found and retry is False
-            return None
+    # Keep the session alive while we wait for tickets, so that
+    # we don't have to log in again right when they show up.
+    session_manager = SessionManager(login_manager, config.get("heartbeat_interval", 60))
+    session_manager.relogin = lambda: login(cookies, retry=True, auto=True)
+    session_manager.mark_valid()
+    session_manager.start()
 
-        # Purchase tickets
-        try:
-            train = select_train(train_list, auto=True)
-            return purchase(cookies, train, auto=True)
-        except UnfinishedTransactionError:
-            # TODO: Change an account if possible?
-            print(localization.UNFINISHED_TRANSACTIONS)
-            return None
-        except DataExpiredError:
-            # This means the user waited too long between
-            # querying train data and submitting the order.
-            # We simply re-query the train list and try again.
-            train_list = query(station_list, retry_search, auto=True)
-            train = select_train(train_list, auto=True)
-            return purchase(cookies, train, auto=True)
-        except NotEnoughTicketsError:
-            # Tickets ran out while we tried to purchase
-            # Just jump back to the beginning of the loop
-            # and try again.
-            pass
+    try:
+        retry_search = config.get("search_retry", True)
+        sleep_time = config.get("search_retry_rate", 1)
+        search = create_train_search(station_list, auto=True, cookies=cookies)
+        purchaser = create_purchaser(cookies)
+        queue = create_candidate_queue(search)
+        while True:
+            # Search for train
+            train_list = query(station_list, retry=retry_search, auto=True, search=search)
+            if train_list is None:
+                # No trains found and retry is False
+                return None
+
+            # Purchase tickets
+            queue.update(train_list)
+            try:
+                order_id = purchase_candidates(search, purchaser, queue, session_manager)
+            except UnfinishedTransactionError:
+                # TODO: Change an account if possible?
+                print(localization.UNFINISHED_TRANSACTIONS)
+                return None
+            except NotLoggedInError:
+                print(localization.SESSION_LOST)
+                return None
+            except SystemMaintenanceError:
+                # Logging in again ran into the nightly maintenance
+                print(localization.SYSTEM_OFFLINE)
+                return None
+            if order_id is not None or purchaser.cancel_token.cancelled:
+                return order_id
+
+            # None of the candidates worked out, search again
+            if not retry_search:
+                return None
+            print(localization.RETRYING_SEARCH.format(sleep_time))
+            time.sleep(sleep_time)
+    finally:
+        session_manager.stop()
 
     login_manager.logout()
 